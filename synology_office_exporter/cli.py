@@ -13,6 +13,8 @@ Options:
   -p, --password PASS    Synology password
   -s, --server HOST      Synology server URL
   -f, --force            Force download all files, ignoring download history
+  -w, --workers N        Number of worker threads listing folders and downloading files (default: 8)
+  --max-downloads N      Maximum number of files downloaded at the same time (default: one per worker)
   --log-level LEVEL      Set the logging level (default: info)
                          Choices: debug, info, warning, error, critical
   -h, --help             Show this help message and exit
@@ -22,6 +24,9 @@ Authentication:
   1. Command line arguments (-u, -p, -s)
   2. Environment variables (via .env file: SYNOLOGY_NAS_USER, SYNOLOGY_NAS_PASS, SYNOLOGY_NAS_HOST)
   3. Interactive prompt
+
+  The workers and the download limit can also be set with the SYNOLOGY_EXPORT_WORKERS and
+  SYNOLOGY_MAX_DOWNLOADS environment variables.
 """
 
 import argparse
@@ -32,7 +37,7 @@ import sys
 from dotenv import load_dotenv
 from synology_office_exporter.download_history import DownloadHistoryFile
 from synology_office_exporter.exception import DownloadHistoryError
-from synology_office_exporter.exporter import SynologyOfficeExporter
+from synology_office_exporter.exporter import DEFAULT_MAX_WORKERS, SynologyOfficeExporter
 from synology_office_exporter.synology_drive_api import SynologyDriveEx
 
 LOG_LEVELS = {
@@ -44,6 +49,25 @@ LOG_LEVELS = {
 }
 
 
+def positive_int(value: str) -> int:
+    """
+    Parse a command line argument which must be a positive integer.
+
+    Args:
+        value: The argument as given on the command line
+
+    Returns:
+        int: The parsed number
+
+    Raises:
+        argparse.ArgumentTypeError: If the number is less than 1
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, got {number}')
+    return number
+
+
 def parse_arguments():  # noqa: D103
     parser = argparse.ArgumentParser(
         description='Download Synology Office files and convert to Microsoft Office format')
@@ -55,6 +79,11 @@ def parse_arguments():  # noqa: D103
     parser.add_argument('-s', '--server', help='Synology server URL')
     parser.add_argument('-f', '--force', action='store_true',
                         help='Force download all files, ignoring download history')
+    parser.add_argument('-w', '--workers', type=positive_int,
+                        help='Number of worker threads listing folders and downloading files '
+                             f'(default: {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--max-downloads', type=positive_int,
+                        help='Maximum number of files downloaded at the same time (default: one per worker)')
     parser.add_argument('--log-level',
                         default='info',
                         choices=LOG_LEVELS.keys(),
@@ -79,6 +108,15 @@ def main():  # noqa: D103
     password = args.password or os.getenv('SYNOLOGY_NAS_PASS')
     server = args.server or os.getenv('SYNOLOGY_NAS_HOST')
 
+    try:
+        workers = args.workers or int(os.getenv('SYNOLOGY_EXPORT_WORKERS', DEFAULT_MAX_WORKERS))
+        max_downloads = args.max_downloads or int(os.getenv('SYNOLOGY_MAX_DOWNLOADS', 0)) or None
+        if workers < 1 or (max_downloads is not None and max_downloads < 1):
+            raise ValueError('the number of workers and downloads must be at least 1')
+    except ValueError as e:
+        logging.error('Invalid concurrency setting: %s', e)
+        return 1
+
     # If still missing credentials, prompt the user
     if not username:
         username = input('Synology username: ')
@@ -95,15 +133,22 @@ def main():  # noqa: D103
     try:
         # Connect to Synology Drive
         with SynologyDriveEx(username, password, server, dsm_version='7') as synd:
+            # Keep one connection alive for each worker; all listings and downloads run on the workers
+            synd.configure_connection_pool(workers)
+
             # Create and use the downloader
             download_history = DownloadHistoryFile(output_dir=args.output, force_download=args.force)
             with SynologyOfficeExporter(synd, output_dir=args.output, force_download=args.force,
-                                        download_history_storage=download_history) as exporter:
+                                        download_history_storage=download_history,
+                                        max_workers=workers, max_downloads=max_downloads) as exporter:
                 exporter.download_files()
 
             # Print summary of export
             print("\n===== Download Results Summary =====\n")
             print(exporter.get_summary())
+            error_summary = exporter.get_error_summary()
+            if error_summary:
+                print(error_summary)
             print("=====================================")
 
         logging.info('Done!')
@@ -113,5 +158,5 @@ def main():  # noqa: D103
         print(f'Error: Problem with download history file - {e}', file=sys.stderr)
         return 1
     except Exception as e:
-        logging.error(f'Error: {e}')
+        logging.error('Error: %s', e)
         return 1
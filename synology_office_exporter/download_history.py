@@ -10,16 +10,59 @@ from filelock import FileLock, Timeout
 import logging
 import os
 import json
-from typing import Dict, Set, TypedDict
+import uuid
+from typing import AbstractSet, Dict, KeysView, Optional, TypedDict
 from datetime import datetime
 from typing_extensions import override
 
 from synology_office_exporter.exception import DownloadHistoryError
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 # Constants for the download history file
 HISTORY_VERSION = 1
 HISTORY_MAGIC = 'SYNOLOGY_OFFICE_EXPORTER'
 
+# The journal is merged into the history file when saving once it holds more entries than
+# 1/JOURNAL_COMPACT_RATIO of the number of files in the history
+JOURNAL_COMPACT_RATIO = 4
+
+
+def _json_loads(data: bytes):
+    """
+    Deserialize JSON data, using orjson when it is available.
+
+    Args:
+        data: UTF-8 encoded JSON document
+
+    Returns:
+        The deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    """
+    Serialize an object to UTF-8 encoded JSON, using orjson when it is available.
+
+    Args:
+        obj: The object to serialize
+
+    Returns:
+        bytes: The JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    # Same compact UTF-8 output as orjson, so the file does not change with the installed packages
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 
 class DownloadHistoryEntry(TypedDict):
     """
@@ -36,6 +79,39 @@ class DownloadHistoryEntry(TypedDict):
     download_time: str
 
 
+def _parse_history(history_data) -> Dict[str, DownloadHistoryEntry]:
+    """
+    Extract the file entries from the deserialized content of a download history file.
+
+    Args:
+        history_data: The deserialized history file
+
+    Returns:
+        dict: The history entries keyed by file path, or an empty dict for a file without metadata
+
+    Raises:
+        DownloadHistoryError: If the file was not written by this program or by a newer version of it
+    """
+    # Check if the history file has version information
+    if not isinstance(history_data, dict) or '_meta' not in history_data:
+        return {}
+    meta = history_data['_meta']
+
+    # Verify magic number
+    if meta.get('magic') != HISTORY_MAGIC:
+        raise DownloadHistoryError(
+            f'History file has incorrect magic number. Expected {HISTORY_MAGIC}, got {meta.get("magic")}')
+
+    # Check version compatibility
+    version = meta.get('version', 0)
+    if version > HISTORY_VERSION:
+        raise DownloadHistoryError(
+            f'History file version {version} is newer than current version {HISTORY_VERSION}. ')
+
+    # Extract the actual file history
+    return history_data.get('files', {})
+
+
 class DownloadHistory(ABC):
     """
     Abstract base class for managing download history.
@@ -100,12 +176,13 @@ class DownloadHistory(ABC):
         """
         pass
 
-    def get_history_keys(self) -> Set[str]:
+    def get_history_keys(self) -> AbstractSet[str]:
         """
         Get the set of keys (file paths) in the download history.
 
         Returns:
-            set: Set of file paths in the history
+            AbstractSet: Set-like view of the file paths in the history. It supports membership
+                         tests and set operations without copying the keys.
         """
         pass
 
@@ -130,6 +207,18 @@ class DownloadHistory(ABC):
         """
         pass
 
+    def get_path_by_file_id(self, file_id: str) -> Optional[str]:
+        """
+        Get the path under which a file was last recorded in the download history.
+
+        Args:
+            file_id: The ID of the file
+
+        Returns:
+            str or None: The file path, or None if the file ID is not in the history
+        """
+        return None
+
 
 class DownloadHistoryFile(DownloadHistory):
     """
@@ -163,9 +252,24 @@ class DownloadHistoryFile(DownloadHistory):
         self.lock_file_path = os.path.join(output_dir, '.download_history.lock')
         self.skip_lock = skip_lock
         self.__download_history_file = os.path.join(output_dir, '.download_history.json')
+        self.__journal_file = os.path.join(output_dir, '.download_history.journal')
         self.__download_history: Dict[str, DownloadHistoryEntry] = {}
         self.force_download = force_download
         self.skip_history = False
+        # Set when the history is modified, so unchanged history is not written again
+        self._dirty = False
+        # Download time recorded for the entries added during the current run
+        self._run_time = None
+        # Index from file ID to file path, built on first use
+        self._paths_by_id: Optional[Dict[str, str]] = None
+        # Changes made after the history has been loaded are appended to the journal, so they
+        # survive an interrupted run; the file is opened on the first change
+        self._journal_enabled = False
+        self._journal = None
+        self._journal_entries = 0
+        # Identifies the history file the journal belongs to; a journal written on top of
+        # another history file, e.g. one which has since been deleted, is discarded
+        self._generation: Optional[str] = None
         self.output_dir = output_dir
 
     def __enter__(self):
@@ -205,64 +309,167 @@ class DownloadHistoryFile(DownloadHistory):
 
                 self.lock.acquire(blocking=False)
         except Timeout:
-            logging.error('Download history lock file already exists. Another process may be running.')
+            logger.error('Download history lock file already exists. Another process may be running.')
             raise DownloadHistoryError('Download history lock file already exists. Another process may be running.')
 
     @override
     def unlock_history(self):  # noqa: D102
+        self._close_journal()
         if self.lock:
             self.lock.release()
 
     @override
     def load_history(self):  # noqa: D102
-        if self.skip_history or not os.path.exists(self.__download_history_file):
-            self.__download_history = {}
+        self._run_time = None
+        self._paths_by_id = None
+        self.__download_history = {}
+        self._generation = None
+        if self.skip_history:
             return
 
         try:
-            with open(self.__download_history_file, 'r') as f:
-                history_data = json.load(f)
+            with open(self.__download_history_file, 'rb') as f:
+                history_data = _json_loads(f.read())
+        except FileNotFoundError:
+            # No history yet, so every file is exported
+            history_data = None
         except Exception as e:
-            logging.error(f'Error loading download history: {e}')
+            logger.error('Error loading download history: %s', e)
             raise DownloadHistoryError(f'Error loading download history file: {e}')
 
-        # Check if the history file has version information
-        if isinstance(history_data, dict) and '_meta' in history_data:
-            meta = history_data['_meta']
+        self.__download_history = _parse_history(history_data)
+        if isinstance(history_data, dict) and isinstance(history_data.get('_meta'), dict):
+            self._generation = history_data['_meta'].get('generation')
+
+        self._replay_journal()
+        self._journal_enabled = True
+
+    def _replay_journal(self):
+        """
+        Apply the changes recorded in the journal since the history file was last written.
+
+        Lines which cannot be parsed, such as one cut short when a previous run was killed
+        while writing it, are skipped. A journal written on top of another history file than
+        the loaded one, e.g. because the history file has been deleted since, is removed
+        without being applied.
+        """
+        self._journal_entries = 0
+        try:
+            f = open(self.__journal_file, 'rb')
+        except FileNotFoundError:
+            return
+
+        with f:
+            lines = f.readlines()
+
+        # The first line names the generation of the history file the journal belongs to
+        generation = None
+        if lines:
+            try:
+                header = _json_loads(lines[0])
+            except ValueError:
+                header = None
+            if isinstance(header, dict) and 'generation' in header:
+                generation = header['generation']
+                lines = lines[1:]
+
+        if generation != self._generation:
+            logger.warning('Discarding download history journal which does not match the history file')
+            os.remove(self.__journal_file)
+            return
 
-            # Verify magic number
-            if meta.get('magic') != HISTORY_MAGIC:
-                raise DownloadHistoryError(
-                    f'History file has incorrect magic number. Expected {HISTORY_MAGIC}, got {meta.get("magic")}')
+        for line in lines:
+            try:
+                record = _json_loads(line)
+                file_path, entry = record['path'], record['entry']
+            except (ValueError, KeyError, TypeError):
+                logger.warning('Skipping corrupted download history journal entry')
+                continue
+            if entry is None:
+                self.__download_history.pop(file_path, None)
+            else:
+                self.__download_history[file_path] = entry
+            self._journal_entries += 1
+
+    def _append_journal(self, file_path: str, entry: Optional[DownloadHistoryEntry]):
+        """
+        Record a change of the history in the journal, if the history has been loaded.
 
-            # Check version compatibility
-            version = meta.get('version', 0)
-            if version > HISTORY_VERSION:
-                raise DownloadHistoryError(
-                    f'History file version {version} is newer than current version {HISTORY_VERSION}. ')
+        Args:
+            file_path: The path of the changed file
+            entry: The new history entry of the file, or None if the entry was removed
+        """
+        if not self._journal_enabled:
+            return
 
-            # Extract the actual file history
-            self.__download_history = history_data.get('files', {})
+        if self._journal is None:
+            journal_dir = os.path.dirname(self.__journal_file)
+            if journal_dir:
+                os.makedirs(journal_dir, exist_ok=True)
+            self._journal = open(self.__journal_file, 'ab')
+            if self._journal.tell() == 0:
+                self._journal.write(_json_dumps({'generation': self._generation}) + b'\n')
+        self._journal.write(_json_dumps({'path': file_path, 'entry': entry}) + b'\n')
+        # Hand the record to the OS right away, so it is kept even if the process is killed
+        self._journal.flush()
+        self._journal_entries += 1
+
+    def _close_journal(self):
+        """
+        Close the journal file if it is open.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
 
     @override
     def save_history(self):  # noqa: D102
-        if self.skip_history:
+        if self.skip_history or not self._dirty:
             return
 
         try:
-            os.makedirs(os.path.dirname(self.__download_history_file), exist_ok=True)
-
-            # Create history data with metadata
+            if (self._journal is not None
+                    and self._journal_entries * JOURNAL_COMPACT_RATIO <= len(self.__download_history)):
+                # The changes are already in the journal; rewriting the whole history is not
+                # worth it until the journal has grown
+                os.fsync(self._journal.fileno())
+                self._dirty = False
+                logger.info('Saved %s download history changes to the journal', self._journal_entries)
+                return
+
+            history_dir = os.path.dirname(self.__download_history_file)
+            if history_dir:
+                os.makedirs(history_dir, exist_ok=True)
+
+            # Create history data with metadata; a new generation ties the next journal to this file
+            generation = uuid.uuid4().hex
+            meta = self._build_metadata()
+            meta['generation'] = generation
             history_data = {
-                '_meta': self._build_metadata(),
+                '_meta': meta,
                 'files': self.__download_history
             }
 
-            with open(self.__download_history_file, 'w') as f:
-                json.dump(history_data, f)
-            logging.info(f'Saved download history for {len(self.__download_history)} files')
+            # Write to a temporary file first so that an interrupted save never leaves
+            # a truncated history file behind
+            tmp_file = self.__download_history_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(_json_dumps(history_data))
+                # Make sure the data is on disk before it replaces the previous history
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.__download_history_file)
+            self._generation = generation
+            self._dirty = False
+
+            # The history file now contains all changes recorded in the journal
+            self._close_journal()
+            if os.path.exists(self.__journal_file):
+                os.remove(self.__journal_file)
+            self._journal_entries = 0
+            logger.info('Saved download history for %s files', len(self.__download_history))
         except Exception as e:
-            logging.error(f'Error saving download history: {e}')
+            logger.error('Error saving download history: %s', e)
 
     @staticmethod
     def _build_metadata():
@@ -280,8 +487,8 @@ class DownloadHistoryFile(DownloadHistory):
         }
 
     @override
-    def get_history_keys(self) -> Set[str]:  # noqa: D102
-        return set(self.__download_history.keys())
+    def get_history_keys(self) -> KeysView[str]:  # noqa: D102
+        return self.__download_history.keys()
 
     @override
     def get_history_entry(self, file_path: str) -> DownloadHistoryEntry:  # noqa: D102
@@ -289,17 +496,37 @@ class DownloadHistoryFile(DownloadHistory):
 
     @override
     def add_history_entry(self, file_path: str, file_id: str, hash_value: str,  # noqa: D102
-                          download_time=datetime.now()) -> None:  # noqa: D102
-        self.__download_history[file_path] = {
+                          download_time: Optional[datetime] = None) -> None:  # noqa: D102
+        if download_time is None:
+            # All files of a run share one timestamp, taken when the first file is recorded
+            if self._run_time is None:
+                self._run_time = datetime.now()
+            download_time = self._run_time
+        entry = {
             'file_id': file_id,
             'hash': hash_value,
             'download_time': str(download_time)
         }
+        self.__download_history[file_path] = entry
+        self._dirty = True
+        self._append_journal(file_path, entry)
+        if self._paths_by_id is not None:
+            self._paths_by_id[file_id] = file_path
 
     @override
     def remove_history_entry(self, file_path: str) -> None:  # noqa: D102
         if file_path in self.__download_history:
-            del self.__download_history[file_path]
+            file_id = self.__download_history.pop(file_path)['file_id']
+            self._dirty = True
+            self._append_journal(file_path, None)
+            if self._paths_by_id is not None and self._paths_by_id.get(file_id) == file_path:
+                del self._paths_by_id[file_id]
+
+    @override
+    def get_path_by_file_id(self, file_id: str) -> Optional[str]:  # noqa: D102
+        if self._paths_by_id is None:
+            self._paths_by_id = {entry['file_id']: path for path, entry in self.__download_history.items()}
+        return self._paths_by_id.get(file_id)
 
     @override
     def should_download(self, file_path: str, hash_value: str) -> bool:  # noqa: D102
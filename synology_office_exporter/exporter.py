@@ -21,15 +21,80 @@ Requirements:
 See cli.py for command line usage instructions.
 """
 
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
 import os
+import random
 import sys
-from typing import Optional
+import threading
+import time
+from typing import Any, Iterable, NamedTuple, Optional, Tuple
+
+import requests
 
 from synology_office_exporter.synology_drive_api import SynologyDriveEx
 from synology_office_exporter.download_history import DownloadHistoryFile
 
+logger = logging.getLogger(__name__)
+
+# Default number of worker threads used to download documents concurrently
+DEFAULT_MAX_WORKERS = 8
+
+# Size of the chunks read when copying an exported file locally
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Number of attempts made for a NAS request which fails with a transient error
+RETRY_ATTEMPTS = 5
+# Delay before the first retry in seconds; doubled for every further retry up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+# Errors caused by network problems which are likely to go away when the request is repeated.
+# A connection lost while a response body is streamed surfaces as ChunkedEncodingError.
+_TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                     ConnectionError, TimeoutError)
+# HTTP status codes of responses which are likely to succeed when the request is repeated
+_TRANSIENT_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+
+# Synology Office file extensions and their Microsoft Office counterparts
+_EXTENSION_MAPPING = {
+    '.osheet': '.xlsx',
+    '.odoc': '.docx',
+    '.oslides': '.pptx'
+}
+
+
+def _is_transient(error: Any) -> bool:
+    """
+    Check whether a request failed for a reason which is likely to go away when it is repeated.
+
+    Responses with an HTTP error status are raised by synology_drive_api as SynologyException,
+    which carries the response, so a busy server (e.g. 503) is recognized by its status code.
+    Authentication and permission errors, TLS errors, missing files and errors reported by the
+    Web API in a successful response are not transient.
+
+    Args:
+        error: The exception raised by the request
+
+    Returns:
+        bool: True if the request should be retried
+    """
+    # SSLError is a ConnectionError, but a certificate problem does not go away by itself
+    if isinstance(error, requests.exceptions.SSLError):
+        return False
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    response = getattr(error, 'response', None) if isinstance(error, requests.RequestException) else None
+    return response is not None and response.status_code in _TRANSIENT_STATUS_CODES
+
+
+class ExportError(NamedTuple):
+    """An error which prevented a file or folder from being exported."""
+    path: Optional[str]
+    message: str
+    retriable: bool
+
 
 class SynologyOfficeExporter:
     """
@@ -49,6 +114,7 @@ class SynologyOfficeExporter:
     - Handles encrypted files and various error conditions gracefully
     - Removes MS Office files when the source Synology Office files are deleted
     - Uses file locking mechanism to prevent multiple processes from running simultaneously
+    - Lists folders and downloads documents concurrently using a pool of worker threads
 
     Usage example:
         with SynologyOfficeExporter(synd_client, output_dir='./exports') as exporter:
@@ -58,7 +124,8 @@ class SynologyOfficeExporter:
     """
 
     def __init__(self, synd: SynologyDriveEx, download_history_storage: DownloadHistoryFile,
-                 output_dir: str = '.', force_download: bool = False):
+                 output_dir: str = '.', force_download: bool = False,
+                 max_workers: int = DEFAULT_MAX_WORKERS, max_downloads: Optional[int] = None):
         """
         Initialize the SynologyOfficeExporter with the given parameters.
 
@@ -66,10 +133,20 @@ class SynologyOfficeExporter:
             synd: SynologyDriveEx instance for API communication
             download_history_storage: DownloadHistoryFile instance for tracking download history
             output_dir: Directory where converted files will be saved
-            force_download: If True, files will be downloaded regardless of download history
+            force_download: If True, files will be downloaded regardless of download history, and are
+                            never copied from other exports
+            max_workers: Number of worker threads used to download documents concurrently
+            max_downloads: Maximum number of documents exported by the NAS at the same time, or None to
+                           allow one per worker. A worker waiting for a download slot is blocked and
+                           does not list folders meanwhile, so a low limit also slows down traversal.
         """
         self.synd = synd
         self.output_dir = output_dir
+        # Output directory with a trailing separator, which output paths are appended to
+        self._output_prefix = os.path.join(output_dir, '')
+        self.force_download = force_download
+        self.max_workers = max_workers
+        self.max_downloads = max_downloads
 
         # Initialize history storage
         self.__history_storage = download_history_storage
@@ -78,6 +155,8 @@ class SynologyOfficeExporter:
         self.total_found_files = 0
         self.skipped_files = 0
         self.downloaded_files = 0
+        # Files written by copying another export with the same content instead of downloading them
+        self.copied_files = 0
         self.deleted_files = 0
 
         # Set to track current files on NAS
@@ -85,25 +164,53 @@ class SynologyOfficeExporter:
 
         # Flag to skip file deletion if any exceptions occurred
         self.had_exceptions = False
+        # Errors which occurred during the export, in the order they occurred
+        self.errors = []
+
+        # Worker pool for downloads; only available while the context manager is active
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Number of submitted tasks which have not finished yet; their futures are not kept, so
+        # memory does not grow with the number of files and folders traversed
+        self._tasks_in_flight = 0
+        self._tasks_done = threading.Condition()
+        # Set when the export is aborted, so no further tasks are submitted or started
+        self._cancelled = False
+
+        # Guards statistics, current_file_paths and history updates made by worker threads
+        self._lock = threading.Lock()
+
+        # Limits the number of concurrent downloads independently of the number of workers
+        self._download_slots = threading.BoundedSemaphore(max_downloads) if max_downloads else None
+
+        # Output directories already created during this export
+        self._created_dirs = set()
+
+        # Folder pages walked during this export, as (folder ID, page offset) pairs
+        self._listed_pages = set()
+
+        # Path of an up-to-date export for each document hash seen during this export
+        self._exports_by_hash = {}
 
     def __enter__(self):
         """
         Context manager entry method.
 
-        Locks the download history file and loads existing history data.
+        Locks the download history file, loads existing history data and starts the worker pool.
 
         Returns:
             SynologyOfficeExporter: The instance itself for use in with statements.
         """
         self.__history_storage.lock_history()
         self.__history_storage.load_history()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         """
         Context manager exit method that saves history and removes deleted files.
 
-        Saves the download history and unlocks the download history file when exiting the context.
+        Waits for pending downloads, then saves the download history and unlocks the download
+        history file when exiting the context.
         Removes files that have been deleted from the NAS only if no exceptions occurred.
 
         Args:
@@ -111,17 +218,21 @@ class SynologyOfficeExporter:
             exc_value: Exception value if an exception was raised
             traceback: Traceback if an exception was raised
         """
-        # Set exception flag if an exception occurred
-        if exc_type is not None:
-            self.had_exceptions = True
-            logging.warning('Exception occurred during processing, skipping file deletion')
-
         try:
+            # Pending downloads must finish before deciding whether deleted files can be removed
+            self._shutdown_executor(cancel_pending=exc_type is not None)
+            self._listed_pages.clear()
+
+            # Set exception flag if an exception occurred
+            if exc_type is not None:
+                self.had_exceptions = True
+                logger.warning('Exception occurred during processing, skipping file deletion')
+
             # Only remove deleted files if no exceptions occurred
             if not self.had_exceptions:
                 self._remove_deleted_files()
             else:
-                logging.info('Skipping file deletion due to exceptions during processing')
+                logger.info('Skipping file deletion due to exceptions during processing')
 
             self.__history_storage.save_history()
         except Exception:
@@ -129,6 +240,119 @@ class SynologyOfficeExporter:
         finally:
             self.__history_storage.unlock_history()
 
+    def _record_error(self, path: Optional[str], error: Any):
+        """
+        Record an error which prevented a file or folder from being exported.
+
+        Setting had_exceptions keeps files deleted from the NAS in the output directory, since the
+        list of current files may be incomplete.
+
+        Args:
+            path: The path or name of the file or folder, or None if it is not known
+            error: The exception or error message
+        """
+        retriable = _is_transient(error)
+        with self._lock:
+            self.errors.append(ExportError(path, str(error), retriable))
+            self.had_exceptions = True
+
+    def _submit(self, fn, *args):
+        """
+        Run a task on the worker pool, or inline when the pool is not active.
+
+        The pool only exists while the context manager is active, so methods called outside of it
+        behave synchronously.
+
+        Args:
+            fn: The callable to run
+            *args: Positional arguments passed to fn
+        """
+        if self._executor is None:
+            fn(*args)
+            return
+
+        with self._tasks_done:
+            if self._cancelled:
+                return
+            self._tasks_in_flight += 1
+        self._executor.submit(self._run_task, fn, *args)
+
+    def _run_task(self, fn, *args):
+        """
+        Run a task submitted to the worker pool and count it as finished.
+
+        Errors which the task did not handle itself are recorded here, since nobody waits for
+        the result of the task.
+
+        Args:
+            fn: The callable to run
+            *args: Positional arguments passed to fn
+        """
+        try:
+            if not self._cancelled:
+                fn(*args)
+        except Exception as e:
+            logger.error('Error in worker task: %s', e)
+            self._record_error(None, e)
+        finally:
+            with self._tasks_done:
+                self._tasks_in_flight -= 1
+                if self._tasks_in_flight == 0:
+                    self._tasks_done.notify_all()
+
+    def _shutdown_executor(self, cancel_pending: bool = False):
+        """
+        Wait for all submitted tasks to finish and shut down the worker pool.
+
+        Tasks may submit further tasks while running, so this waits until no task is left.
+
+        Args:
+            cancel_pending: If True, tasks which have not started yet are skipped and running
+                            tasks can no longer submit further tasks
+        """
+        if self._executor is None:
+            return
+
+        with self._tasks_done:
+            if cancel_pending:
+                self._cancelled = True
+            while self._tasks_in_flight:
+                self._tasks_done.wait()
+
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._cancelled = False
+
+    def _retry(self, fn, *args, **kwargs):
+        """
+        Call a function, retrying it with exponential backoff when it fails with a transient error.
+
+        Network errors and responses with a status such as 429 or 503 are transient. The delay before
+        each retry doubles, is capped at RETRY_MAX_DELAY and randomized by up to half, so that workers
+        which failed at the same time do not retry in lockstep.
+
+        Args:
+            fn: The callable to run
+            *args: Positional arguments passed to fn
+            **kwargs: Keyword arguments passed to fn
+
+        Returns:
+            The return value of fn
+
+        Raises:
+            Exception: The error raised by the last attempt, or any non-transient error
+        """
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not _is_transient(e) or attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+                delay -= random.uniform(0, delay / 2)
+                logger.warning('Request failed (%s), retrying in %.1f seconds', e, delay)
+                time.sleep(delay)
+
     def _remove_deleted_files(self):
         """
         Remove files from the output directory that have been deleted from the NAS.
@@ -137,32 +361,32 @@ class SynologyOfficeExporter:
         file list, deletes those files from the local filesystem, and updates the download history.
         The method will set had_exceptions flag if errors occur during deletion.
         """
-        logging.info('Removing deleted files...')
+        logger.info('Removing deleted files...')
         deleted_file_paths = sorted(self.__history_storage.get_history_keys() - self.current_file_paths)
         for file_path in deleted_file_paths:
             try:
                 offline_name = self.convert_synology_to_ms_office_filename(file_path)
                 if offline_name is None:
-                    logging.error(f'Cannot determine offline name for {file_path}')
+                    logger.error('Cannot determine offline name for %s', file_path)
                     continue
-                output_path = os.path.join(self.output_dir, offline_name.lstrip('/'))
+                output_path = self._output_path(offline_name)
 
-                logging.info(f'Removing deleted file: {output_path}')
+                logger.info('Removing deleted file: %s', output_path)
                 try:
                     os.remove(output_path)
                     self.deleted_files += 1
                 except FileNotFoundError:
-                    logging.warning(f'File already removed: {output_path}')
+                    logger.warning('File already removed: %s', output_path)
 
                 self.__history_storage.remove_history_entry(file_path)
 
             except Exception as e:
-                logging.error(f'Error removing deleted file {file_path}: {e}')
+                logger.error('Error removing deleted file %s: %s', file_path, e)
                 # Set the exception flag to prevent future deletions in this session
-                self.had_exceptions = True
+                self._record_error(file_path, e)
                 return
 
-        logging.info(f'Removed {self.deleted_files} files that were deleted from the NAS')
+        logger.info('Removed %s files that were deleted from the NAS', self.deleted_files)
 
     def _download_mydrive_files(self):
         """
@@ -174,23 +398,24 @@ class SynologyOfficeExporter:
         Exceptions during processing are caught and logged, allowing the process
         to continue with other files. The had_exceptions flag is set if errors occur.
         """
-        logging.info('Downloading My Drive files...')
+        logger.info('Downloading My Drive files...')
         try:
             self._process_directory('/mydrive', 'My Drive')
         except Exception as e:
-            logging.error(f'Error downloading My Drive files: {e}')
-            self.had_exceptions = True
+            logger.error('Error downloading My Drive files: %s', e)
+            self._record_error('My Drive', e)
 
     def download_files(self):
         """
         Download and process all Synology Office files.
 
         This method is a wrapper that calls the individual download methods for
-        My Drive, shared files, and team folders.
+        My Drive, shared files, and team folders. While the context manager is active they
+        run on the worker pool, so the three sources are traversed concurrently.
         """
-        self._download_mydrive_files()
-        self._download_shared_files()
-        self._download_teamfolder_files()
+        self._submit(self._download_mydrive_files)
+        self._submit(self._download_shared_files)
+        self._submit(self._download_teamfolder_files)
 
     def _download_shared_files(self):
         """
@@ -202,17 +427,30 @@ class SynologyOfficeExporter:
         Exceptions during processing are caught and logged, allowing the process
         to continue with other files. The had_exceptions flag is set if errors occur.
         """
-        logging.info('Downloading shared files...')
+        logger.info('Downloading shared files...')
         try:
+            # Shared items are processed on the worker pool, like the items of a directory
             for item in self.synd.shared_with_me():
-                try:
-                    self._process_item(item)
-                except Exception as e:
-                    logging.error(f'Error processing shared item {item.get("name")}: {e}')
-                    self.had_exceptions = True
+                self._submit(self._try_process_item, item)
         except Exception as e:
-            logging.error(f'Error accessing shared files: {e}')
-            self.had_exceptions = True
+            logger.error('Error accessing shared files: %s', e)
+            self._record_error(None, e)
+
+    def _try_process_item(self, item):
+        """
+        Process a single item listed in a directory or shared with the user.
+
+        Args:
+            item: Dictionary containing item information from the Synology API
+
+        Errors, e.g. of a malformed item, are logged and set the had_exceptions flag, so the other
+        items of the listing are still processed.
+        """
+        try:
+            self._process_item(item)
+        except Exception as e:
+            logger.error('Error processing item %s: %s', item.get('name'), e)
+            self._record_error(item.get('name'), e)
 
     def _download_teamfolder_files(self):
         """
@@ -224,17 +462,30 @@ class SynologyOfficeExporter:
         Exceptions during processing are caught and logged, allowing the process
         to continue with other files and folders. The had_exceptions flag is set if errors occur.
         """
-        logging.info('Downloading team folder files...')
+        logger.info('Downloading team folder files...')
         try:
+            # Team folders are listed on the worker pool, so their listings overlap
             for name, file_id in self.synd.get_teamfolder_info().items():
-                try:
-                    self._process_directory(file_id, name)
-                except Exception as e:
-                    logging.error(f'Error processing team folder {name}: {e}')
-                    self.had_exceptions = True
+                self._submit(self._process_teamfolder, file_id, name)
         except Exception as e:
-            logging.error(f'Error accessing team folders: {e}')
-            self.had_exceptions = True
+            logger.error('Error accessing team folders: %s', e)
+            self._record_error(None, e)
+
+    def _process_teamfolder(self, file_id: str, name: str):
+        """
+        Process a single team folder.
+
+        Args:
+            file_id: The ID of the team folder
+            name: The name of the team folder
+
+        Errors are logged and set the had_exceptions flag, so other team folders are still processed.
+        """
+        try:
+            self._process_directory(file_id, name)
+        except Exception as e:
+            logger.error('Error processing team folder %s: %s', name, e)
+            self._record_error(name, e)
 
     def _process_item(self, item):
         """
@@ -247,54 +498,87 @@ class SynologyOfficeExporter:
         Args:
             item: Dictionary containing item information from the Synology API
 
-        The had_exceptions flag is set if errors occur during processing.
+        Errors in directories and documents are handled by _process_directory and
+        _process_document. Any other error, such as a malformed item, propagates to the caller,
+        usually _try_process_item.
         """
-        try:
-            file_id = item['file_id']
-            display_path = item.get('display_path', item.get('name'))
-            content_type = item['content_type']
-            hash = item.get('hash')
-
-            if content_type == 'dir':
-                self._process_directory(file_id, display_path)
-            elif content_type == 'document':
-                if item.get('encrypted'):
-                    logging.info(f'Skipping encrypted file: {display_path}')
-                    return
-                self._process_document(file_id, display_path, hash)
-        except Exception as e:
-            logging.error(f'Error processing item {item.get("name")}: {e}')
-            self.had_exceptions = True
+        file_id = item['file_id']
+        display_path = item.get('display_path', item.get('name'))
+        content_type = item['content_type']
+        hash = item.get('hash')
+
+        if content_type == 'dir':
+            self._process_directory(file_id, display_path)
+        elif content_type == 'document':
+            offline_name = self.convert_synology_to_ms_office_filename(display_path)
+            if not offline_name:
+                logger.debug('Skipping non-Synology Office file: %s', display_path)
+                return
+            if item.get('encrypted'):
+                logger.info('Skipping encrypted file: %s', display_path)
+                return
+            self._process_document(file_id, display_path, hash, offline_name)
 
-    def _process_directory(self, file_id: str, dir_name: str):
+    def _process_directory(self, file_id: str, dir_name: str, offset: int = 0):
         """
         Process a directory and all its contents from the Synology NAS.
 
         This method lists all items in the specified directory and processes
-        each one by calling _process_item.
+        each one by calling _process_item on the worker pool. Large directories are
+        listed page by page.
 
         Args:
             file_id: The ID of the directory to process
             dir_name: The display name of the directory for logging purposes
+            offset: Index of the first item to process
 
         The had_exceptions flag is set if errors occur during processing.
         """
-        logging.debug(f'Processing directory: {dir_name}')
+        logger.debug('Processing directory: %s', dir_name)
+
+        # A folder can be reached more than once, e.g. when a subfolder of a team folder is also
+        # shared with the user; its documents are the same, so each page is walked only once
+        page = (file_id, offset)
+        with self._lock:
+            if page in self._listed_pages:
+                logger.debug('Skipping directory already processed: %s', dir_name)
+                return
+            self._listed_pages.add(page)
 
         try:
-            resp = self.synd.list_folder(file_id)
+            resp = self._retry(self.synd.list_folder, file_id, offset=offset)
             if not resp['success']:
-                logging.error(f'Failed to list folder {dir_name}: {resp.get("error")}')
-                self.had_exceptions = True
+                logger.error('Failed to list folder %s: %s', dir_name, resp.get('error'))
+                self._record_error(dir_name, resp.get('error'))
+                self._forget_page(page)
                 return
 
-            for item in resp['data']['items']:
-                self._process_item(item)
+            # The next page is listed on the worker pool while the items of this page are processed
+            items = resp['data']['items']
+            if items and offset + len(items) < resp['data'].get('total', 0):
+                self._submit(self._process_directory, file_id, dir_name, offset + len(items))
+
+            # Subdirectories are listed and documents downloaded by the worker pool, so
+            # listings of sibling directories overlap with each other and with downloads
+            for item in items:
+                self._submit(self._try_process_item, item)
         except Exception as e:
-            logging.error(f'Error processing directory {dir_name}: {e}')
-            self.had_exceptions = True
+            logger.error('Error processing directory %s: %s', dir_name, e)
+            self._record_error(dir_name, e)
+            self._forget_page(page)
+
+    def _forget_page(self, page: Tuple[str, int]):
+        """
+        Allow a folder page which could not be listed to be walked again when it is reached later.
+
+        Args:
+            page: The (folder ID, page offset) pair of the page
+        """
+        with self._lock:
+            self._listed_pages.discard(page)
 
-    def _process_document(self, file_id: str, display_path: str, hash: str):
+    def _process_document(self, file_id: str, display_path: str, hash: str,
+                          offline_name: Optional[str] = None):
         """
         Process and download a Synology Office document.
 
@@ -306,45 +590,180 @@ class SynologyOfficeExporter:
             file_id: The ID of the file to download
             display_path: The display path of the file
             hash: The hash of the file to track changes
+            offline_name: The Microsoft Office file name for display_path, if already known
 
         The had_exceptions flag is set if errors occur during processing.
         The current_file_paths set is updated to track which files exist on the NAS.
         """
-        logging.debug(f'Processing {display_path}')
+        logger.debug('Processing %s', display_path)
         try:
-            offline_name = self.convert_synology_to_ms_office_filename(display_path)
-            if not offline_name:
-                logging.debug(f'Skipping non-Synology Office file: {display_path}')
+            if offline_name is None:
+                offline_name = self.convert_synology_to_ms_office_filename(display_path)
+                if not offline_name:
+                    logger.debug('Skipping non-Synology Office file: %s', display_path)
+                    return
+
+            with self._lock:
+                # A document can be reached more than once, e.g. through a team folder and as a
+                # shared file; it is exported only once, so two workers never write the same file
+                if display_path in self.current_file_paths:
+                    logger.debug('Skipping document already processed: %s', display_path)
+                    return
+                self.current_file_paths.add(display_path)
+                self.total_found_files += 1
+
+            output_path = self._output_path(offline_name)
+
+            if hash is None:
+                # Without a hash the history check could never match, so fetch it from the
+                # file's metadata rather than downloading the whole file again
+                resp = self._retry(self.synd.get_file_or_folder_info, file_id)
+                if resp.get('success'):
+                    hash = resp.get('data', {}).get('hash')
+                else:
+                    logger.warning('Failed to look up the hash of %s: %s', display_path, resp.get('error'))
+                if hash is None:
+                    logger.info('Downloading as the hash of the document is unknown: %s', display_path)
+
+            # Check if file is already downloaded and unchanged; a document without a hash
+            # cannot be compared with its previous export, so it is always downloaded
+            if hash is not None and not self.__history_storage.should_download(display_path, hash):
+                if os.path.exists(output_path):
+                    logger.info('Skipping already downloaded file: %s', display_path)
+                    with self._lock:
+                        self.skipped_files += 1
+                        self._record_export(hash, output_path)
+                    return
+                logger.info('Downloading again as the exported file is missing: %s', output_path)
+
+            # Reuse an export with the same content instead of downloading it again, unless the
+            # history and previous exports are to be ignored
+            local_copy = None
+            if not self.force_download and hash is not None:
+                local_copy = self._find_local_copy(file_id, hash, output_path)
+            if local_copy is not None:
+                logger.info('Copying %s => %s', local_copy, output_path)
+                self._copy_file(local_copy, output_path)
+                with self._lock:
+                    self.copied_files += 1
+                    self._record_export(hash, output_path)
+                    self.__history_storage.add_history_entry(display_path, file_id, hash)
                 return
 
-            self.current_file_paths.add(display_path)
-            self.total_found_files += 1
+            logger.info('Downloading %s => %s', display_path, output_path)
+            self._retry(self._download_document, file_id, display_path, output_path)
 
-            # Check if file is already downloaded and unchanged
-            if not self.__history_storage.should_download(display_path, hash):
-                logging.info(f'Skipping already downloaded file: {display_path}')
-                self.skipped_files += 1
-                return
+            with self._lock:
+                self.downloaded_files += 1
+                self._record_export(hash, output_path)
+
+                # Save download info to history
+                self.__history_storage.add_history_entry(display_path, file_id, hash)
+        except Exception as e:
+            logger.error('Error downloading document %s: %s', display_path, e)
+            self._record_error(display_path, e)
+
+    def _record_export(self, hash: Optional[str], output_path: str):
+        """
+        Remember an up-to-date export, so documents with the same hash can be copied from it.
 
-            # Convert absolute path to relative by removing leading slashes
-            offline_name = offline_name.lstrip('/')
+        Must be called with self._lock held.
 
-            # Create full path with output directory
-            output_path = os.path.join(self.output_dir, offline_name)
+        Args:
+            hash: The hash of the exported document
+            output_path: The path of the exported file
+        """
+        if hash is not None:
+            self._exports_by_hash.setdefault(hash, output_path)
 
-            logging.info(f'Downloading {display_path} => {output_path}')
-            data = self.synd.download_synology_office_file(file_id)
-            self.save_bytesio_to_file(data, output_path)
+    def _output_path(self, offline_name: str) -> str:
+        """
+        Get the path in the output directory where an exported file is saved.
 
-            self.downloaded_files += 1
+        Args:
+            offline_name: The Microsoft Office file name including its path on the NAS
 
-            # Save download info to history
-            self.__history_storage.add_history_entry(display_path, file_id, hash)
-        except Exception as e:
-            logging.error(f'Error downloading document {display_path}: {e}')
-            self.had_exceptions = True
+        Returns:
+            str: The path below the output directory
+        """
+        # Convert absolute path to relative by removing leading slashes
+        return self._output_prefix + offline_name.lstrip('/')
+
+    def _find_local_copy(self, file_id: str, hash: str, output_path: str) -> Optional[str]:
+        """
+        Find an exported file in the output directory with the same content as a document.
+
+        When a file is renamed or moved on the NAS its file ID and hash stay the same, so the
+        export from its previous path can be reused; the copy at the previous path is removed
+        later along with other deleted files. Documents with the same hash as a document
+        already exported during this run have identical content and can be copied as well.
+
+        Args:
+            file_id: The ID of the file
+            hash: The current hash of the file
+            output_path: Destination file path for the current path of the file
+
+        Returns:
+            str or None: The path of an export which can be copied, or None if the document has
+                         to be downloaded
+        """
+        candidates = []
+        with self._lock:
+            old_path = self.__history_storage.get_path_by_file_id(file_id)
+            entry = self.__history_storage.get_history_entry(old_path) if old_path else None
+            if entry and entry['file_id'] == file_id and entry['hash'] == hash:
+                candidates.append(self._output_path(self.convert_synology_to_ms_office_filename(old_path)))
+            if hash is not None and hash in self._exports_by_hash:
+                candidates.append(self._exports_by_hash[hash])
+
+        for path in candidates:
+            if path != output_path and os.path.exists(path):
+                return path
+        return None
+
+    def _copy_file(self, src_path: str, output_path: str):
+        """
+        Copy an exported file within the output directory.
+
+        Args:
+            src_path: The exported file to copy
+            output_path: Destination file path
+        """
+        with open(src_path, 'rb') as f:
+            self.save_stream_to_file(iter(functools.partial(f.read, COPY_CHUNK_SIZE), b''), output_path)
+
+    def _download_document(self, file_id: str, display_path: str, output_path: str):
+        """
+        Download a document from the NAS in Microsoft Office format and save it.
+
+        Args:
+            file_id: The ID of the file to download
+            display_path: The display path of the file
+            output_path: Destination file path where the exported file will be saved
+        """
+        if self._download_slots is None:
+            self._stream_document(file_id, display_path, output_path)
+        else:
+            # The slot is released between retries, so waiting for a retry does not block other downloads
+            with self._download_slots:
+                self._stream_document(file_id, display_path, output_path)
+
+    def _stream_document(self, file_id: str, display_path: str, output_path: str):
+        """
+        Stream a document from the NAS in Microsoft Office format to a file.
+
+        Args:
+            file_id: The ID of the file to download
+            display_path: The display path of the file
+            output_path: Destination file path where the exported file will be saved
+        """
+        # The name is known from the listing, which saves a metadata request per download
+        chunks = self.synd.download_synology_office_file_stream(
+            file_id, file_name=os.path.basename(display_path))
+        self.save_stream_to_file(chunks, output_path)
 
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def convert_synology_to_ms_office_filename(name: str) -> Optional[str]:
         """
         Converts Synology Office file names to Microsoft Office file names.
@@ -354,6 +773,8 @@ class SynologyOfficeExporter:
         - odoc -> docx (Word)
         - oslides -> pptx (PowerPoint)
 
+        Results are cached since the same names are converted repeatedly during an export.
+
         Args:
             name: The file name to convert
 
@@ -361,39 +782,56 @@ class SynologyOfficeExporter:
             str or None: The file name with corresponding Microsoft Office extension.
                         Returns None if not a Synology Office file.
         """
-        extension_mapping = {
-            '.osheet': '.xlsx',
-            '.odoc': '.docx',
-            '.oslides': '.pptx'
-        }
-        for ext, new_ext in extension_mapping.items():
-            if name.endswith(ext):
-                return name[: -len(ext)] + new_ext
-        return None
+        # Unlike os.path.splitext, rpartition also converts names that are only an extension
+        base, _, ext = name.rpartition('.')
+        new_ext = _EXTENSION_MAPPING.get('.' + ext)
+        return base + new_ext if new_ext else None
 
-    @staticmethod
-    def save_bytesio_to_file(data: BytesIO, path: str):
+    def _ensure_dir(self, dir_name: str):
         """
-        Save the contents of a BytesIO object to a file.
+        Create a directory, unless it was already created during this export.
+
+        Many documents share the same output directory, so remembering the directories
+        which exist avoids calling os.makedirs for every downloaded file.
+
+        Args:
+            dir_name: The directory to create
+        """
+        if not dir_name or dir_name in self._created_dirs:
+            return
+        os.makedirs(dir_name, exist_ok=True)
+        self._created_dirs.add(dir_name)
+
+    def save_stream_to_file(self, chunks: Iterable[bytes], path: str):
+        """
+        Save chunks of data to a file as they arrive.
 
         This method creates any necessary parent directories before writing the file.
-        The BytesIO position is reset to the beginning before reading.
+        The data is written to a temporary file next to the destination which is renamed
+        into place once complete, so a failed download never leaves a truncated file behind.
 
         Args:
-            data: BytesIO object containing the file data
+            chunks: Iterable yielding the file data in chunks
             path: Destination file path where data will be saved
         """
-        data.seek(0)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'wb') as f:
-            f.write(data.getvalue())
+        self._ensure_dir(os.path.dirname(path))
+        part_path = path + '.part'
+        try:
+            with open(part_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(part_path, path)
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
 
     def get_summary(self) -> str:
         """
         Get a summary of the download statistics.
 
         This method returns a formatted string containing the counts of found, skipped,
-        downloaded, and deleted files.
+        downloaded, copied, and deleted files.
         Returns:
             str: A summary of the download statistics.
         """
@@ -401,9 +839,29 @@ class SynologyOfficeExporter:
             f'Total files found for backup: {self.total_found_files}\n'
             f'Files skipped: {self.skipped_files}\n'
             f'Files downloaded: {self.downloaded_files}\n'
+            f'Files copied: {self.copied_files}\n'
             f'Files deleted: {self.deleted_files}\n'
         )
 
+    def get_error_summary(self) -> str:
+        """
+        Get a list of the errors which prevented files or folders from being exported.
+
+        Errors which are likely to go away, such as network errors, are marked, since running
+        the export again may succeed for them.
+
+        Returns:
+            str: The number of errors followed by one line per error, or an empty string if no
+                 error occurred.
+        """
+        if not self.errors:
+            return ''
+        lines = [f'Errors: {len(self.errors)}']
+        for error in self.errors:
+            note = ' (temporary, may succeed when run again)' if error.retriable else ''
+            lines.append(f'  {error.path or "(unknown)"}: {error.message}{note}')
+        return '\n'.join(lines) + '\n'
+
 
 if __name__ == '__main__':
     print('This file is a library. Please use main.py to run the program.')
@@ -1,7 +1,114 @@
+from typing import Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from synology_drive_api.base import add_sid_token, raise_synology_exception
 from synology_drive_api.drive import SynologyDrive
 
+# Size of the chunks read from the network while streaming a download. Large chunks keep the
+# number of read and write calls per exported file low.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Number of items requested per page when listing folders and shared files. The Web API returns
+# at most this many items per request, so larger folders are listed page by page.
+LIST_PAGE_SIZE = 1000
+
+
+class IncompleteDownloadError(requests.ConnectionError):
+    """The connection was closed before the whole response body was received."""
+
 
 class SynologyDriveEx(SynologyDrive):
+    def configure_connection_pool(self, pool_maxsize: int):
+        """
+        Mount an HTTP adapter which keeps up to pool_maxsize connections to the NAS alive.
+
+        All API calls go through a single requests.Session. Its default pool keeps only 10
+        connections per host, so concurrent downloads beyond that would open a new TCP/TLS
+        connection for every request. The adapter does not retry failed requests, so error
+        responses reach raise_synology_exception; retries are left to the caller.
+        :param pool_maxsize: maximum number of keep-alive connections, usually the number of workers
+        """
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        for prefix in ('http://', 'https://'):
+            self.session.req_session.mount(prefix, adapter)
+
+    def download_synology_office_file_stream(self, file_id: str, file_name: Optional[str] = None,
+                                             chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Export a Synology Office file and yield its content chunk by chunk.
+
+        Unlike download_synology_office_file(), the response body is never held in memory as a
+        whole, so memory usage does not grow with the size of the exported file.
+        :param file_id: file id "552146100935505098"
+        :param file_name: name of the file, e.g. "report.osheet"; looked up on the NAS if omitted,
+                          which costs an additional request
+        :param chunk_size: number of bytes read from the network at a time
+        :return: iterator over the chunks of the exported file
+        """
+        if file_name is None:
+            file_name = self.get_file_or_folder_info(file_id)['data']['name']
+        export_end_point = file_name.replace('osheet', 'xlsx').replace('odoc', 'docx')
+
+        api_name = 'SYNO.Office.Export'
+        endpoint = f'entry.cgi/{export_end_point}'
+        params = {'api': api_name, 'method': 'download', 'version': 1, 'path': f'id:{file_id}'}
+        yield from self._http_get_stream(endpoint, params, chunk_size)
+
+    def _http_get_stream(self, endpoint: str, params: dict, chunk_size: int) -> Iterator[bytes]:
+        """
+        Send a GET request to the Web API and yield the response body chunk by chunk.
+
+        SynologySession.http_get() always reads the whole body, so the request is sent through
+        the underlying requests.Session in the same way SynologySession does it.
+        :param endpoint: api endpoint relative to the webapi base url
+        :param params: query parameters of the request
+        :param chunk_size: number of bytes read from the network at a time
+        :return: iterator over the chunks of the response body
+        """
+        url = f'{self.session._base_url}{endpoint}'
+        kwargs = add_sid_token({'params': params}, self.session.sid)
+        parsed_url = urlparse(url)
+        if parsed_url.scheme == 'https' and parsed_url.netloc.count('.') >= 3:
+            # SynologySession skips certificate verification when the NAS is accessed by IP address
+            kwargs['verify'] = False
+        with self.session.req_session.get(url, stream=True, **kwargs) as resp:
+            raise_synology_exception(resp, bio_exist=True)
+            # urllib3 1.x does not check the length of the body, so a connection closed early
+            # would otherwise end the download silently with a truncated file
+            expected_length = _content_length(resp)
+            received_length = 0
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                received_length += len(chunk)
+                yield chunk
+            if expected_length is not None and received_length < expected_length:
+                raise IncompleteDownloadError(
+                    f'Received {received_length} of {expected_length} bytes from {endpoint}')
+
+    def list_folder(self, dir_path: str, offset: int = 0, limit: int = LIST_PAGE_SIZE) -> dict:
+        """
+        List one page of the items in a folder.
+
+        SynologyDrive.list_folder() always requests the first page, so items beyond the first
+        1000 of a folder were never listed.
+        :param dir_path: '/team-folders/folder_name/folder_name1' or '430167496067125111'
+        :param offset: index of the first item to list
+        :param limit: maximum number of items to list
+        :return: response whose data contains the 'items' of the page and the 'total' number of items
+        """
+        if dir_path.isdigit():
+            dest_path = f'id:{dir_path}'
+        else:
+            # add start position /
+            dest_path = f'/{dir_path}' if not dir_path.startswith('/') else dir_path
+
+        api_name = 'SYNO.SynologyDrive.Files'
+        endpoint = 'entry.cgi'
+        params = {'api': api_name, 'version': 2, 'method': 'list', 'filter': {}, 'sort_direction': 'asc',
+                  'sort_by': 'owner', 'offset': offset, 'limit': limit, 'path': dest_path}
+        return self.session.http_get(endpoint, params=params)
+
     def shared_with_me(self):
         """
         get shared folder info
@@ -10,14 +117,31 @@ class SynologyDriveEx(SynologyDrive):
         # {"include_transient":true}
         api_name = 'SYNO.SynologyDrive.Files'
         endpoint = 'entry.cgi'
-        params = {'api': api_name, 'version': 2, 'method': 'shared_with_me', 'filter': {}, 'sort_direction': 'asc',
-                  'sort_by': 'name', 'offset': 0, 'limit': 1000}
-        resp = self.session.http_get(endpoint, params=params)
+        items = []
+        while True:
+            params = {'api': api_name, 'version': 2, 'method': 'shared_with_me', 'filter': {},
+                      'sort_direction': 'asc', 'sort_by': 'name', 'offset': len(items), 'limit': LIST_PAGE_SIZE}
+            resp = self.session.http_get(endpoint, params=params)
+
+            if not resp['success']:
+                raise Exception('Get shared_with_me info failed.')
 
-        if not resp['success']:
-            raise Exception('Get shared_with_me info failed.')
+            page = resp['data']['items']
+            items.extend(page)
+            if not page or len(items) >= resp['data']['total']:
+                return items
 
-        if resp['data']['total'] == 0:
-            return {}
 
-        return resp['data']['items']
+def _content_length(resp: requests.Response) -> Optional[int]:
+    """
+    Get the length of the body declared by a response.
+    :param resp: the response
+    :return: the number of bytes iter_content() yields, or None if it is not known in advance
+    """
+    if resp.headers.get('Content-Encoding', 'identity') != 'identity':
+        # iter_content() yields the decoded body, whose length differs from Content-Length
+        return None
+    try:
+        return int(resp.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
@@ -9,6 +9,23 @@ from synology_office_exporter.exporter import SynologyOfficeExporter
 from tests.mock_download_history import MockDownloadHistory
 
 
+class FakeDownloadHistory(MockDownloadHistory):
+    """Download history holding a fixed set of paths and recording the removed ones."""
+
+    def __init__(self, history_keys=()):
+        super().__init__()
+        self.history_keys = set(history_keys)
+        self.removed_entries = []
+
+    def get_history_keys(self):
+        """Return the paths in the history."""
+        return self.history_keys
+
+    def remove_history_entry(self, file_path):
+        """Record the removed path."""
+        self.removed_entries.append(file_path)
+
+
 class TestDeletedFiles(unittest.TestCase):
     """Test suite for verifying proper cleanup of exported files when original Synology Office files are deleted."""
 
@@ -16,40 +33,21 @@ class TestDeletedFiles(unittest.TestCase):
         """Set up test environment before each test."""
         self.mock_synd = MagicMock()
 
-        self.sample_history = {
-            '/path/to/document.odoc': {
-                'file_id': 'file_id_1',
-                'hash': 'hash1',
-                'path': '/path/to/document.odoc',
-                'download_time': '2023-01-01 12:00:00'
-            },
-            '/path/to/spreadsheet.osheet': {
-                'file_id': 'file_id_2',
-                'hash': 'hash2',
-                'path': '/path/to/spreadsheet.osheet',
-                'download_time': '2023-01-01 12:00:00'
-            }
-        }
-
-    @patch('os.path.exists')
     @patch('os.remove')
-    def test_remove_deleted_files(self, mock_remove, mock_path_exists):
+    def test_remove_deleted_files(self, mock_remove):
         """Test that files deleted from NAS are removed from the output directory."""
-        mock_path_exists.return_value = True
-
-        download_history = MagicMock()
+        download_history = FakeDownloadHistory()
         with SynologyOfficeExporter(self.mock_synd, download_history,
                                     output_dir='/tmp/synology_office_exports') as exporter:
             # Simliate that the history file is loaded, and there were two files when the exporter was executed
             # last time.
-            download_history.get_history_keys.return_value = set(
-                ['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
+            download_history.history_keys = {'/path/to/document.odoc', '/path/to/spreadsheet.osheet'}
 
             # Simulate that one file still exists on NAS (document.odoc) and one is deleted (spreadsheet.osheet)
             exporter.current_file_paths = set(['/path/to/document.odoc'])
 
         # Check that the deleted file is removed from history
-        download_history.remove_history_entry.assert_called_once_with('/path/to/spreadsheet.osheet')
+        self.assertEqual(download_history.removed_entries, ['/path/to/spreadsheet.osheet'])
         mock_remove.assert_called_once_with('/tmp/synology_office_exports/path/to/spreadsheet.xlsx')
 
         # Check that the counter was incremented
@@ -58,12 +56,10 @@ class TestDeletedFiles(unittest.TestCase):
     @patch('os.remove')
     def test_file_already_removed(self, mock_remove):
         """Test handling of files that are already removed from the filesystem."""
-        download_history = MagicMock()
-        exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/tmp/synology_office_exports')
         # Simliate that the history file is loaded, and there were two files when the exporter was executed
         # last time.
-        download_history.get_history_keys.return_value = set(
-            ['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
+        download_history = FakeDownloadHistory(['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
+        exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/tmp/synology_office_exports')
 
         # Simulate that one file is deleted from NAS
         exporter.current_file_paths = {'/path/to/document.odoc'}
@@ -78,7 +74,7 @@ class TestDeletedFiles(unittest.TestCase):
         mock_remove.assert_called_once_with('/tmp/synology_office_exports/path/to/spreadsheet.xlsx')
 
         # Check that the file is removed from history
-        download_history.remove_history_entry.assert_called_once_with('/path/to/spreadsheet.osheet')
+        self.assertEqual(download_history.removed_entries, ['/path/to/spreadsheet.osheet'])
 
         # Check that the counter wasn't incremented (no actual deletion)
         self.assertEqual(exporter.deleted_files, 0)
@@ -88,9 +84,7 @@ class TestDeletedFiles(unittest.TestCase):
         """Test that no files are removed when all files still exist on NAS."""
         # Simliate that the history file is loaded, and there were two files when the exporter was
         # executed last time.
-        download_history = MagicMock()
-        download_history.get_history_keys.return_value = set(
-            ['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
+        download_history = FakeDownloadHistory(['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
         with SynologyOfficeExporter(self.mock_synd, download_history,
                                     output_dir='/tmp/synology_office_exports') as exporter:
             # Simulate that all files still exist on the NAS
@@ -100,7 +94,7 @@ class TestDeletedFiles(unittest.TestCase):
         mock_remove.assert_not_called()
 
         # Check that the history is unchanged
-        download_history.remove_history_entry.assert_not_called()
+        self.assertEqual(download_history.removed_entries, [])
 
         # Check that the counter wasn't incremented
         self.assertEqual(exporter.deleted_files, 0)
@@ -108,28 +102,23 @@ class TestDeletedFiles(unittest.TestCase):
     @patch('os.remove')
     def test_save_updated_history(self, mock_remove):
         """Test that updated history (after removal) is saved correctly."""
-        download_history = MagicMock()
-        download_history.get_history_keys.return_value = set(['/path/to/document.odoc'])
+        download_history = FakeDownloadHistory(['/path/to/document.odoc'])
 
         with SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/tmp/synology_office_exports'):
             pass
 
         # Verify that the deleted file from the NAS device is removed locally, and history is updated.
-        download_history.remove_history_entry.assert_called_once_with('/path/to/document.odoc')
+        self.assertEqual(download_history.removed_entries, ['/path/to/document.odoc'])
         mock_remove.assert_called_once_with('/tmp/synology_office_exports/path/to/document.docx')
 
     @patch('os.remove')
     def test_exception_during_file_deletion_stops_further_deletions(self, mock_remove):
         """Test that an exception during file deletion stops further deletions."""
-        download_history = MagicMock()
-
-        exporter = SynologyOfficeExporter(
-            self.mock_synd, download_history, output_dir='/tmp/synology_office_exports')
-
         # Simliate that the history file is loaded, and there were two files when the exporter was executed
         # last time.
-        download_history.get_history_keys.return_value = set(
-            ['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
+        download_history = FakeDownloadHistory(['/path/to/document.odoc', '/path/to/spreadsheet.osheet'])
+        exporter = SynologyOfficeExporter(
+            self.mock_synd, download_history, output_dir='/tmp/synology_office_exports')
 
         # Mark both files as deleted
         exporter.current_file_paths = set()
@@ -145,7 +134,7 @@ class TestDeletedFiles(unittest.TestCase):
 
         mock_remove.assert_called_once_with('/tmp/synology_office_exports/path/to/document.docx')
 
-    @patch('synology_office_exporter.exporter.SynologyOfficeExporter._remove_deleted_files')
+    @patch.object(SynologyOfficeExporter, '_remove_deleted_files')
     def test_file_deletion_in_context_manager(self, mock_remove_deleted_files):
         exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(),
                                           output_dir='/tmp/synology_office_exports')
@@ -156,7 +145,7 @@ class TestDeletedFiles(unittest.TestCase):
         # Verify deletion occurred
         mock_remove_deleted_files.assert_called_once()
 
-    @patch('synology_office_exporter.exporter.SynologyOfficeExporter._remove_deleted_files')
+    @patch.object(SynologyOfficeExporter, '_remove_deleted_files')
     def test_no_file_deletion_in_context_manager_with_exceptions_handled(self, mock_remove_deleted_files):
         exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(),
                                           output_dir='/tmp/synology_office_exports')
@@ -167,7 +156,7 @@ class TestDeletedFiles(unittest.TestCase):
         # Verify deletion not occurred
         mock_remove_deleted_files.assert_not_called()
 
-    @patch('synology_office_exporter.exporter.SynologyOfficeExporter._remove_deleted_files')
+    @patch.object(SynologyOfficeExporter, '_remove_deleted_files')
     def test_no_file_deletion_in_context_manager_with_exceptions_not_handled(self, mock_remove_deleted_files):
         exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(),
                                           output_dir='/tmp/synology_office_exports')
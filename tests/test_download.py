@@ -1,8 +1,13 @@
 """Unit tests for the SynologyOfficeExporter download functionality."""
+import threading
+import time
 import unittest
-from unittest.mock import patch, MagicMock, call
-from io import BytesIO
-from synology_office_exporter.exporter import SynologyOfficeExporter
+from unittest.mock import patch, Mock, MagicMock, call
+
+import requests
+from synology_drive_api.base import SynologyException
+
+from synology_office_exporter.exporter import RETRY_ATTEMPTS, ExportError, SynologyOfficeExporter
 from synology_office_exporter.synology_drive_api import SynologyDriveEx
 from tests.mock_download_history import MockDownloadHistory
 
@@ -11,7 +16,10 @@ class TestDownload(unittest.TestCase):
     """Test suite for the SynologyOfficeExporter download functionality."""
 
     def setUp(self):
-        self.mock_synd = MagicMock(spec=SynologyDriveEx)
+        self.mock_synd = Mock(spec=SynologyDriveEx)
+        # Documents processed without a hash from the listing look it up in the file metadata
+        self.mock_synd.get_file_or_folder_info.return_value = {'success': True, 'data': {'hash': 'nas-hash'}}
+        self.exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir')
 
     def test_process_document(self):
         """Test processing a document file."""
@@ -31,29 +39,19 @@ class TestDownload(unittest.TestCase):
                 ]
             }
         }
-        self.mock_synd.download_synology_office_file.return_value = BytesIO(b'test data')
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'test data']
 
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save:
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir')
-            exporter._process_document('123', 'path/to/test.osheet', hash=None)
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
+            self.exporter._process_document('123', 'path/to/test.osheet', hash=None)
 
-        # Check if download_synology_office_file was called correctly
-        self.mock_synd.download_synology_office_file.assert_called_once_with('123')
+        # Check if download_synology_office_file_stream was called correctly
+        self.mock_synd.download_synology_office_file_stream.assert_called_once_with('123', file_name='test.osheet')
 
-        # Check if save_bytesio_to_file was called with correct parameters
+        # Check if save_stream_to_file was called with correct parameters
         args, kwargs = mock_save.call_args
-        self.assertEqual(args[0].getvalue(), b'test data')
+        self.assertEqual(list(args[0]), [b'test data'])
         self.assertEqual(args[1], '/test/dir/path/to/test.xlsx')
 
-    def test_convert_synology_to_ms_office_filename(self):
-        """Test conversion of Synology Office filenames to MS Office filenames."""
-        # For Synology Office files, convert to MS Office extensions
-        self.assertEqual(SynologyOfficeExporter.convert_synology_to_ms_office_filename('test.osheet'), 'test.xlsx')
-        self.assertEqual(SynologyOfficeExporter.convert_synology_to_ms_office_filename('test.odoc'), 'test.docx')
-        self.assertEqual(SynologyOfficeExporter.convert_synology_to_ms_office_filename('test.oslides'), 'test.pptx')
-        # For other files, return None
-        self.assertIsNone(SynologyOfficeExporter.convert_synology_to_ms_office_filename('test.txt'))
-
     def test_download_shared_files(self):
         """Test downloading files shared with the user."""
         self.mock_synd.shared_with_me.return_value = [
@@ -62,12 +60,11 @@ class TestDownload(unittest.TestCase):
         ]
 
         with patch.object(SynologyOfficeExporter, '_process_item') as mock_process_item:
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._download_shared_files()
+            self.exporter._download_shared_files()
 
-        # Verify _process_item was called for each shared item
-        self.assertEqual(mock_process_item.call_count, 2)
-        mock_process_item.assert_has_calls([
+        # Verify _process_item was called once for each shared item, in any order since items
+        # may be processed concurrently on the worker pool
+        self.assertEqual(sorted(mock_process_item.call_args_list, key=repr), [
             call({'file_id': '123', 'content_type': 'document', 'name': 'doc1'}),
             call({'file_id': '456', 'content_type': 'dir', 'name': 'folder1'})
         ])
@@ -80,15 +77,13 @@ class TestDownload(unittest.TestCase):
         }
 
         with patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory:
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._download_teamfolder_files()
+            self.exporter._download_teamfolder_files()
 
-        # Verify _process_directory was called for each team folder
-        self.assertEqual(mock_process_directory.call_count, 2)
-        mock_process_directory.assert_has_calls([
-            call('789', 'Team Folder 1'),
-            call('012', 'Team Folder 2')
-        ], any_order=True)  # Order of dictionary items is not guaranteed
+        # Verify _process_directory was called once for each team folder, in any order
+        self.assertEqual(sorted(mock_process_directory.call_args_list, key=repr), [
+            call('012', 'Team Folder 2'),
+            call('789', 'Team Folder 1')
+        ])
 
     def test_process_item_dir(self):
         """Test processing a directory item."""
@@ -99,8 +94,7 @@ class TestDownload(unittest.TestCase):
         }
         with patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory, \
                 patch.object(SynologyOfficeExporter, '_process_document') as mock_process_document:
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._process_item(item)
+            self.exporter._process_item(item)
 
         mock_process_directory.assert_called_once_with('456', 'path/to/folder')
         mock_process_document.assert_not_called()
@@ -116,11 +110,10 @@ class TestDownload(unittest.TestCase):
 
         with patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory, \
                 patch.object(SynologyOfficeExporter, '_process_document') as mock_process_document:
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._process_item(item)
+            self.exporter._process_item(item)
 
         # Modify this line to check with positional arguments instead of keyword arguments
-        mock_process_document.assert_called_once_with('123', 'path/to/doc.osheet', None)
+        mock_process_document.assert_called_once_with('123', 'path/to/doc.osheet', None, 'path/to/doc.xlsx')
         mock_process_directory.assert_not_called()
 
     def test_process_item_encrypted_doc(self):
@@ -134,19 +127,40 @@ class TestDownload(unittest.TestCase):
 
         with patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory, \
                 patch.object(SynologyOfficeExporter, '_process_document') as mock_process_document:
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._process_item(item)
+            self.exporter._process_item(item)
 
         mock_process_document.assert_not_called()
         mock_process_directory.assert_not_called()
 
-    @patch('synology_office_exporter.exporter.SynologyOfficeExporter._process_directory')
+    @patch.object(SynologyOfficeExporter, '_process_directory')
     def test_download_mydrive_files(self, mock_process_directory):
-        exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-
-        exporter._download_mydrive_files()
+        self.exporter._download_mydrive_files()
         mock_process_directory.assert_called_once_with('/mydrive', 'My Drive')
 
+    def test_process_item_skips_non_office_document(self):
+        """Test that a document which cannot be exported never reaches the download path."""
+        item = {'content_type': 'document', 'encrypted': False, 'name': 'a.pdf',
+                'display_path': 'path/to/a.pdf', 'file_id': '789'}
+
+        with patch.object(SynologyOfficeExporter, '_process_document') as mock_process_document:
+            self.exporter._process_item(item)
+
+        mock_process_document.assert_not_called()
+        self.assertEqual(self.exporter.total_found_files, 0)
+        self.assertEqual(self.exporter.current_file_paths, set())
+
+    def test_process_item_skips_unknown_content_type(self):
+        """Test that items which are neither folders nor documents are ignored."""
+        item = {'content_type': 'shortcut', 'name': 'link.odoc', 'display_path': 'path/to/link.odoc',
+                'file_id': '789'}
+
+        with patch.object(SynologyOfficeExporter, '_process_document') as mock_process_document, \
+                patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory:
+            self.exporter._process_item(item)
+
+        mock_process_document.assert_not_called()
+        mock_process_directory.assert_not_called()
+
     def test_exception_handling_shared_files(self):
         """Test that the program continues downloading even if some files cause exceptions."""
         # Set up mock to have 3 files, with processing of the second one raising an exception
@@ -156,28 +170,41 @@ class TestDownload(unittest.TestCase):
             {'file_id': '789', 'content_type': 'document', 'name': 'doc2'}
         ]
 
+        processed_ids = []
+
         with patch.object(SynologyOfficeExporter, '_process_item') as mock_process_item:
             # Make the second file raise an exception when processed
             def side_effect(item):
+                processed_ids.append(item['file_id'])
                 if item['file_id'] == '456':
                     raise Exception('Test error')
                 return None
             mock_process_item.side_effect = side_effect
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._download_shared_files()
+            self.exporter._download_shared_files()
 
         # Verify all items were attempted to be processed, despite the exception
-        self.assertEqual(mock_process_item.call_count, 3)
-        mock_process_item.assert_any_call({'file_id': '123', 'content_type': 'document', 'name': 'doc1'})
-        mock_process_item.assert_any_call({'file_id': '456', 'content_type': 'dir', 'name': 'folder1'})
-        mock_process_item.assert_any_call({'file_id': '789', 'content_type': 'document', 'name': 'doc2'})
+        self.assertEqual(processed_ids, ['123', '456', '789'])
+
+    def test_exception_handling_shared_files_on_worker_pool(self):
+        """Test that a failing shared item on the worker pool does not stop the other items."""
+        self.mock_synd.shared_with_me.return_value = [
+            {'file_id': '123', 'content_type': 'document', 'name': 'doc1'},
+            {'file_id': '456', 'content_type': 'document', 'name': 'doc2'},
+        ]
+
+        with patch.object(SynologyOfficeExporter, '_process_item') as mock_process_item:
+            mock_process_item.side_effect = [Exception('Test error'), None]
+            with SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), max_workers=2) as exporter:
+                exporter._download_shared_files()
+
+        self.assertEqual(mock_process_item.call_count, 2)
+        self.assertTrue(exporter.had_exceptions)
 
     def test_exception_handling_mydrive(self):
         """Test that exceptions in _process_directory do not stop execution."""
         with patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory:
             mock_process_directory.side_effect = Exception('Test error')
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._download_mydrive_files()
+            self.exporter._download_mydrive_files()
 
         # Verify _process_directory was called with correct parameters
         mock_process_directory.assert_called_once_with('/mydrive', 'My Drive')
@@ -190,54 +217,120 @@ class TestDownload(unittest.TestCase):
             'Team Folder 3': '333'
         }
 
+        processed_folders = set()
+
         with patch.object(SynologyOfficeExporter, '_process_directory') as mock_process_directory:
             # Make processing of 'Team Folder 2' raise an exception
             def side_effect(file_id, name):
+                processed_folders.add((file_id, name))
                 if file_id == '222':
                     raise Exception('Test error')
                 return None
             mock_process_directory.side_effect = side_effect
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._download_teamfolder_files()
+            self.exporter._download_teamfolder_files()
 
         # Verify all team folders were attempted to be processed
         self.assertEqual(mock_process_directory.call_count, 3)
-        mock_process_directory.assert_any_call('111', 'Team Folder 1')
-        mock_process_directory.assert_any_call('222', 'Team Folder 2')
-        mock_process_directory.assert_any_call('333', 'Team Folder 3')
+        self.assertEqual(processed_folders, {
+            ('111', 'Team Folder 1'),
+            ('222', 'Team Folder 2'),
+            ('333', 'Team Folder 3'),
+        })
+        self.assertEqual(self.exporter.errors, [ExportError('Team Folder 2', 'Test error', False)])
 
     def test_exception_handling_download_synology(self):
         """Test that exceptions during file download do not stop processing."""
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save:
-            self.mock_synd.download_synology_office_file.side_effect = Exception('Download failed')
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
+            self.mock_synd.download_synology_office_file_stream.side_effect = Exception('Download failed')
 
-            exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory())
-            exporter._process_document('123', 'path/to/test.osheet', hash=None)
-        # Verify no exceptions were raised and the download was attempted.
+            self.exporter._process_document('123', 'path/to/test.osheet', hash=None)
 
-        self.mock_synd.download_synology_office_file.assert_called_once_with('123')
+        # Verify no exceptions were raised, the download was attempted, and the error was recorded.
+        self.mock_synd.download_synology_office_file_stream.assert_called_once_with('123', file_name='test.osheet')
         mock_save.assert_not_called()
-
-    def test_download_history_skips_should_not_download_files(self):
-        """Test that files already in download history are skipped."""
+        self.assertTrue(self.exporter.had_exceptions)
+
+    def test_download_history_skips_unchanged_files(self):
+        """Test that a file in download history is skipped unless its exported copy is missing."""
+        for output_exists, expected_downloads in ((True, 0), (False, 1)):
+            with self.subTest(output_exists=output_exists):
+                self.mock_synd.download_synology_office_file_stream.reset_mock()
+                self.mock_synd.download_synology_office_file_stream.return_value = [b'test data']
+                download_history = MagicMock()
+                download_history.should_download.return_value = False
+                with patch('os.path.exists', return_value=output_exists), \
+                        patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
+                    exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir')
+                    exporter._process_document('123', 'path/to/test.osheet', 'old-hash')
+
+                self.assertEqual(self.mock_synd.download_synology_office_file_stream.call_count, expected_downloads)
+                self.assertEqual(mock_save.call_count, expected_downloads)
+                self.assertEqual(exporter.skipped_files, 1 - expected_downloads)
+                if expected_downloads:
+                    self.assertEqual(mock_save.call_args[0][1], '/test/dir/path/to/test.xlsx')
+
+    def test_process_document_looks_up_missing_hash(self):
+        """Test that the hash is fetched from the file metadata when the listing does not provide it."""
         download_history = MagicMock()
         download_history.should_download.return_value = False
-        with SynologyOfficeExporter(self.mock_synd, download_history) as exporter:
-            exporter._process_document('123', 'path/to/test.osheet', 'old-hash')
+        self.mock_synd.get_file_or_folder_info.return_value = {'success': True, 'data': {'hash': 'nas-hash'}}
+        with patch('os.path.exists', return_value=True):
+            exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir')
+            exporter._process_document('123', 'path/to/test.osheet', None)
+
+        self.mock_synd.get_file_or_folder_info.assert_called_once_with('123')
+        download_history.should_download.assert_called_once_with('path/to/test.osheet', 'nas-hash')
+        self.mock_synd.download_synology_office_file_stream.assert_not_called()
+
+    def test_process_document_downloads_when_hash_lookup_fails(self):
+        """Test that a document is downloaded when its hash cannot be looked up."""
+        responses = {
+            'failed': {'success': False, 'error': {'code': 1002}},
+            'no hash': {'success': True, 'data': {}},
+        }
+        for name, resp in responses.items():
+            with self.subTest(name):
+                self.mock_synd.reset_mock()
+                self.mock_synd.get_file_or_folder_info.return_value = resp
+                self.mock_synd.download_synology_office_file_stream.return_value = [b'data']
+                download_history = MagicMock()
+                download_history.should_download.return_value = False
+                download_history.get_path_by_file_id.return_value = None
+                with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
+                    exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir')
+                    exporter._process_document('123', 'path/to/test.osheet', None)
+
+                download_history.should_download.assert_not_called()
+                mock_save.assert_called_once()
+                self.assertEqual(exporter.downloaded_files, 1)
+                self.assertFalse(exporter.had_exceptions)
+
+    def test_process_document_retries_hash_lookup(self):
+        """Test that a transient error while looking up the hash is retried."""
+        download_history = MagicMock()
+        download_history.should_download.return_value = False
+        self.mock_synd.get_file_or_folder_info.side_effect = [
+            requests.ConnectionError('reset'),
+            {'success': True, 'data': {'hash': 'nas-hash'}},
+        ]
+        with patch('os.path.exists', return_value=True), patch('time.sleep'):
+            exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir')
+            exporter._process_document('123', 'path/to/test.osheet', None)
 
-        # Verify that download was not attempted
-        self.mock_synd.download_synology_office_file.assert_not_called()
+        self.assertEqual(self.mock_synd.get_file_or_folder_info.call_count, 2)
+        download_history.should_download.assert_called_once_with('path/to/test.osheet', 'nas-hash')
+        self.assertFalse(exporter.had_exceptions)
 
     def test_download_history_saves_files(self):
         """Test that new files are added to download history."""
-        self.mock_synd.download_synology_office_file.return_value = BytesIO(b'new file data')
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'new file data']
         download_history = MagicMock()
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save, \
-                SynologyOfficeExporter(self.mock_synd, download_history) as exporter:
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save, \
+                SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir') as exporter:
             exporter._process_document('456', 'path/to/new.osheet', 'new-file-hash')
 
         # Verify that download was attempted
-        self.mock_synd.download_synology_office_file.assert_called_once_with('456')
+        self.mock_synd.download_synology_office_file_stream.assert_called_once_with('456', file_name='new.osheet')
         mock_save.assert_called_once()
         download_history.add_history_entry.assert_called_once_with(
             'path/to/new.osheet', '456', 'new-file-hash')
@@ -248,7 +341,7 @@ class TestDownload(unittest.TestCase):
         download_history = MockDownloadHistory()
 
         # Use the custom history storage with the exporter
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file'), \
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file'), \
                 SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir',) as exporter:
             # Verify that lock and load methods were called during initialization
             self.assertTrue(download_history.lock_called)
@@ -271,6 +364,286 @@ class TestDownload(unittest.TestCase):
         self.assertTrue(download_history.save_called)
         self.assertTrue(download_history.unlock_called)
 
+    def test_process_directory_downloads_in_worker_pool(self):
+        """Test that documents are downloaded by the worker pool and finished when the context exits."""
+        self.mock_synd.list_folder.return_value = {
+            'success': True,
+            'data': {
+                'items': [
+                    {'content_type': 'document', 'encrypted': False, 'name': f'test{i}.osheet',
+                     'display_path': f'path/to/test{i}.osheet', 'file_id': str(i), 'hash': f'hash{i}'}
+                    for i in range(5)
+                ]
+            }
+        }
+        self.mock_synd.download_synology_office_file_stream.side_effect = lambda *args, **kwargs: iter([b'test data'])
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save, \
+                SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir',
+                                       max_workers=3) as exporter:
+            exporter._process_directory('dir_id', 'path/to')
+
+        self.assertEqual(self.mock_synd.download_synology_office_file_stream.call_count, 5)
+        self.assertEqual(mock_save.call_count, 5)
+        self.assertEqual(exporter.downloaded_files, 5)
+        self.assertEqual(exporter.current_file_paths, {f'path/to/test{i}.osheet' for i in range(5)})
+        self.assertFalse(exporter.had_exceptions)
+
+    def test_process_directory_lists_subdirectories_in_worker_pool(self):
+        """Test that nested directories submitted to the worker pool are all traversed."""
+        listings = {
+            'root': [
+                {'content_type': 'dir', 'name': 'a', 'display_path': 'root/a', 'file_id': 'a'},
+                {'content_type': 'dir', 'name': 'b', 'display_path': 'root/b', 'file_id': 'b'},
+            ],
+            'a': [
+                {'content_type': 'dir', 'name': 'c', 'display_path': 'root/a/c', 'file_id': 'c'},
+                {'content_type': 'document', 'name': 'a.odoc', 'display_path': 'root/a/a.odoc',
+                 'file_id': 'doc_a', 'hash': 'hash_a'},
+            ],
+            'b': [
+                {'content_type': 'document', 'name': 'b.osheet', 'display_path': 'root/b/b.osheet',
+                 'file_id': 'doc_b', 'hash': 'hash_b'},
+            ],
+            'c': [
+                {'content_type': 'document', 'name': 'c.oslides', 'display_path': 'root/a/c/c.oslides',
+                 'file_id': 'doc_c', 'hash': 'hash_c'},
+            ],
+        }
+        self.mock_synd.list_folder.side_effect = lambda file_id, offset: {
+            'success': True, 'data': {'items': listings[file_id]}}
+        self.mock_synd.download_synology_office_file_stream.side_effect = lambda *args, **kwargs: iter([b'test data'])
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file'), \
+                SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir',
+                                       max_workers=2) as exporter:
+            exporter._process_directory('root', 'root')
+
+        self.assertEqual(self.mock_synd.list_folder.call_count, 4)
+        self.assertEqual(exporter.current_file_paths,
+                         {'root/a/a.odoc', 'root/b/b.osheet', 'root/a/c/c.oslides'})
+        self.assertEqual(exporter.downloaded_files, 3)
+        self.assertFalse(exporter.had_exceptions)
+
+    def test_interrupted_export_stops_listing_subdirectories(self):
+        """Test that an exception in the with block stops the traversal and the history is still saved."""
+        listing_started = threading.Event()
+
+        def list_folder(file_id, offset):
+            listing_started.set()
+            # Return the listing only once the export has been aborted
+            deadline = time.monotonic() + 5
+            while not exporter._cancelled and time.monotonic() < deadline:
+                time.sleep(0.001)
+            return {'success': True, 'data': {'items': [
+                {'content_type': 'dir', 'name': name, 'display_path': f'root/{name}', 'file_id': name}
+                for name in ('a', 'b', 'c')
+            ]}}
+
+        self.mock_synd.list_folder.side_effect = list_folder
+        download_history = MockDownloadHistory()
+
+        with self.assertRaises(KeyboardInterrupt):
+            with SynologyOfficeExporter(self.mock_synd, download_history, output_dir='/test/dir',
+                                        max_workers=2) as exporter:
+                exporter._submit(exporter._process_directory, 'root', 'root')
+                listing_started.wait(5)
+                raise KeyboardInterrupt
+
+        # The subdirectories listed after the interruption are not traversed
+        self.mock_synd.list_folder.assert_called_once_with('root', offset=0)
+        self.assertTrue(exporter.had_exceptions)
+        self.assertTrue(download_history.save_called)
+        self.assertTrue(download_history.unlock_called)
+
+    def test_max_downloads_limits_concurrent_downloads(self):
+        """Test that no more than max_downloads documents are downloaded at the same time."""
+        self.mock_synd.list_folder.return_value = {
+            'success': True,
+            'data': {'items': [
+                {'content_type': 'document', 'name': f'{i}.odoc', 'display_path': f'{i}.odoc',
+                 'file_id': str(i), 'hash': f'hash{i}'} for i in range(4)
+            ]}
+        }
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def slow_download(chunks, path):
+            with lock:
+                active.append(path)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(path)
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file', side_effect=slow_download), \
+                SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir',
+                                       max_workers=4, max_downloads=1) as exporter:
+            exporter._process_directory('root', 'root')
+
+        self.assertEqual(exporter.downloaded_files, 4)
+        self.assertEqual(max(peak), 1)
+
+    def test_download_files_traverses_all_sources(self):
+        """Test that download_files processes My Drive, shared files and team folders on the worker pool."""
+        self.mock_synd.shared_with_me.return_value = [
+            {'content_type': 'document', 'name': 'shared.osheet', 'display_path': 'shared.osheet',
+             'file_id': 'shared', 'hash': 'hash_shared'},
+        ]
+        self.mock_synd.get_teamfolder_info.return_value = {'Team': 'team'}
+        listings = {
+            '/mydrive': [{'content_type': 'document', 'name': 'mine.odoc', 'display_path': 'mine.odoc',
+                          'file_id': 'mine', 'hash': 'hash_mine'}],
+            'team': [{'content_type': 'document', 'name': 'team.oslides', 'display_path': 'Team/team.oslides',
+                      'file_id': 'team_doc', 'hash': 'hash_team'}],
+        }
+        self.mock_synd.list_folder.side_effect = lambda file_id, offset: {
+            'success': True, 'data': {'items': listings[file_id]}}
+        self.mock_synd.download_synology_office_file_stream.side_effect = lambda *args, **kwargs: iter([b'test data'])
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file'), \
+                SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir',
+                                       max_workers=2) as exporter:
+            exporter.download_files()
+
+        self.assertEqual(exporter.current_file_paths, {'mine.odoc', 'shared.osheet', 'Team/team.oslides'})
+        self.assertEqual(exporter.downloaded_files, 3)
+        self.assertFalse(exporter.had_exceptions)
+
+    def test_document_reached_twice_is_exported_once(self):
+        """Test that a document listed both as a shared file and in My Drive is downloaded and counted once."""
+        item = {'content_type': 'document', 'name': 'report.osheet', 'display_path': 'report.osheet',
+                'file_id': '123', 'hash': 'hash'}
+        self.mock_synd.shared_with_me.return_value = [item]
+        self.mock_synd.get_teamfolder_info.return_value = {}
+        self.mock_synd.list_folder.return_value = {'success': True, 'data': {'items': [item]}}
+        self.mock_synd.download_synology_office_file_stream.side_effect = lambda *args, **kwargs: iter([b'test data'])
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file'), \
+                SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir',
+                                       max_workers=2) as exporter:
+            exporter.download_files()
+
+        self.mock_synd.download_synology_office_file_stream.assert_called_once()
+        self.assertEqual(exporter.total_found_files, 1)
+        self.assertEqual(exporter.downloaded_files, 1)
+
+    def test_malformed_item_does_not_stop_other_items(self):
+        """Test that an item without a file_id is reported while the other items are still processed."""
+        self.mock_synd.list_folder.return_value = {
+            'success': True,
+            'data': {'items': [
+                {'content_type': 'document', 'name': 'broken.osheet', 'display_path': 'path/to/broken.osheet'},
+                {'content_type': 'document', 'name': 'test.osheet', 'display_path': 'path/to/test.osheet',
+                 'file_id': '123', 'hash': 'hash'},
+            ]}
+        }
+        self.mock_synd.download_synology_office_file_stream.side_effect = lambda *args, **kwargs: iter([b'test data'])
+
+        for use_pool in (False, True):
+            with self.subTest(use_pool=use_pool):
+                exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir')
+                with patch.object(SynologyOfficeExporter, 'save_stream_to_file'):
+                    if use_pool:
+                        with exporter:
+                            exporter._process_directory('dir_id', 'path/to')
+                    else:
+                        exporter._process_directory('dir_id', 'path/to')
+
+                self.assertEqual(exporter.current_file_paths, {'path/to/test.osheet'})
+                self.assertEqual(exporter.downloaded_files, 1)
+                self.assertEqual(exporter.errors, [ExportError('broken.osheet', "'file_id'", False)])
+
+    @patch('time.sleep')
+    def test_transient_download_error_is_retried(self, mock_sleep):
+        """Test that a download interrupted by a connection error is retried."""
+        def interrupted_download(file_id, file_name):
+            yield b'partial'
+            raise requests.ConnectionError('Connection reset')
+
+        self.mock_synd.download_synology_office_file_stream.side_effect = [
+            interrupted_download('123', 'test.osheet'), [b'test data']]
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file',
+                          side_effect=lambda chunks, path: list(chunks)) as mock_save:
+            self.exporter._process_document('123', 'path/to/test.osheet', 'hash')
+
+        self.assertEqual(mock_save.call_count, 2)
+        mock_sleep.assert_called_once()
+        self.assertEqual(self.exporter.downloaded_files, 1)
+        self.assertFalse(self.exporter.had_exceptions)
+
+    @patch('time.sleep')
+    def test_download_succeeds_after_repeated_connection_errors(self, mock_sleep):
+        """Test that a download failing to connect twice is saved on the third attempt."""
+        self.mock_synd.download_synology_office_file_stream.side_effect = [
+            ConnectionError('Connection refused'), requests.ConnectionError('Connection refused'), [b'ok']]
+
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file',
+                          side_effect=lambda chunks, path: list(chunks)) as mock_save:
+            self.exporter._process_document('123', 'path/to/test.osheet', 'hash')
+
+        self.assertEqual(self.mock_synd.download_synology_office_file_stream.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        mock_save.assert_called_once_with([b'ok'], '/test/dir/path/to/test.xlsx')
+        self.assertEqual(self.exporter.downloaded_files, 1)
+        self.assertFalse(self.exporter.had_exceptions)
+
+    @patch('time.sleep')
+    def test_transient_listing_error_gives_up_after_retries(self, mock_sleep):
+        """Test that listing a folder is given up after RETRY_ATTEMPTS transient failures."""
+        self.mock_synd.list_folder.side_effect = requests.Timeout('Read timed out')
+
+        self.exporter._process_directory('dir_id', 'path/to')
+
+        self.assertEqual(self.mock_synd.list_folder.call_count, RETRY_ATTEMPTS)
+        self.assertEqual(mock_sleep.call_count, RETRY_ATTEMPTS - 1)
+        self.assertTrue(self.exporter.had_exceptions)
+        self.assertEqual(self.exporter.errors, [ExportError('path/to', 'Read timed out', True)])
+
+    @patch('time.sleep')
+    def test_busy_server_response_is_retried(self, mock_sleep):
+        """Test that requests rejected with a transient HTTP status are retried, but others are not."""
+        for status_code, expected_calls in ((503, RETRY_ATTEMPTS), (429, RETRY_ATTEMPTS), (403, 1), (404, 1)):
+            with self.subTest(status_code=status_code):
+                self.mock_synd.list_folder.reset_mock()
+                self.mock_synd.list_folder.side_effect = SynologyException(
+                    response=MagicMock(status_code=status_code, text=''))
+
+                exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir='/test/dir')
+                exporter._process_directory('dir_id', 'path/to')
+
+                self.assertEqual(self.mock_synd.list_folder.call_count, expected_calls)
+                self.assertEqual(exporter.errors[0].retriable, expected_calls > 1)
+
+    def test_permission_error_is_not_retried(self):
+        """Test that a download failing with a permission error is attempted only once."""
+        self.mock_synd.download_synology_office_file_stream.side_effect = PermissionError('Permission denied')
+
+        self.exporter._process_document('123', 'path/to/test.osheet', 'hash')
+
+        self.mock_synd.download_synology_office_file_stream.assert_called_once()
+        self.assertTrue(self.exporter.had_exceptions)
+
+    def test_ssl_error_is_not_retried(self):
+        """Test that a TLS failure, although a connection error, fails immediately."""
+        self.mock_synd.list_folder.side_effect = requests.exceptions.SSLError('certificate verify failed')
+
+        self.exporter._process_directory('dir_id', 'path/to')
+
+        self.mock_synd.list_folder.assert_called_once_with('dir_id', offset=0)
+        self.assertFalse(self.exporter.errors[0].retriable)
+
+    def test_non_transient_error_is_not_retried(self):
+        """Test that errors other than network errors fail immediately."""
+        self.mock_synd.list_folder.side_effect = Exception('Permission denied')
+
+        self.exporter._process_directory('dir_id', 'path/to')
+
+        self.mock_synd.list_folder.assert_called_once_with('dir_id', offset=0)
+        self.assertTrue(self.exporter.had_exceptions)
+
     def test_context_manager(self):
         """Test that context manager loads and saves download history."""
         mock_download_history = MockDownloadHistory()
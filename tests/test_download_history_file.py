@@ -3,9 +3,12 @@ Test suite for the DownloadHistoryFile class.
 """
 import json
 import os
+import shutil
+import tempfile
 import unittest
 
 from datetime import datetime
+from synology_office_exporter import download_history
 from synology_office_exporter.download_history import HISTORY_MAGIC, DownloadHistoryFile
 from synology_office_exporter.exception import DownloadHistoryError
 from unittest.mock import patch
@@ -16,42 +19,58 @@ class TestDownloadHistory(unittest.TestCase):
 
     def setUp(self):
         """Set up test environment before each test."""
-        # Create a mock SynologyDriveEx instance
-        self.output_dir = '/tmp/synology_office_exports'
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.output_dir = os.path.join(self.temp_dir, 'output')
+        self.history_file = os.path.join(self.output_dir, '.download_history.json')
 
-    @patch('json.load')
-    @patch('builtins.open')
-    @patch('os.path.exists')
-    def test_load_download_history(self, mock_exists, mock_open, mock_json_load):
-        """Test loading download history from a file."""
-        mock_json_load.return_value = {
+    def write_history_file(self, data: bytes):
+        """Write the raw content of the download history file."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.history_file, 'wb') as f:
+            f.write(data)
+
+    def write_history(self, files: dict, version: int = 1, magic: str = HISTORY_MAGIC):
+        """Write a download history file with the given entries."""
+        self.write_history_file(json.dumps({
             '_meta': {
-                'version': 1,
-                'magic': HISTORY_MAGIC,
+                'version': version,
+                'magic': magic,
                 'created': '2025-03-22 14:43:44.966404',
                 'program': 'synology-office-exporter'
             },
-            'files': {
-                '/path/to/document.odoc': {
-                    'hash': 'hash1',
-                    'file_id': 'file_id_1',
-                    'download_time': '2023-01-01 12:00:00'
-                }
+            'files': files
+        }).encode())
+
+    def test_load_download_history(self):
+        """Test loading download history from a file."""
+        self.write_history({
+            '/path/to/document.odoc': {
+                'hash': 'hash1',
+                'file_id': 'file_id_1',
+                'download_time': '2023-01-01 12:00:00'
             }
-        }
+        })
 
-        mock_exists.return_value = True
         history_storage = DownloadHistoryFile(output_dir=self.output_dir, skip_lock=True)
         history_storage.load_history()
 
-        # Verify loaded history
-        mock_open.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'), 'r')
         self.assertEqual(history_storage.get_history_entry('/path/to/document.odoc'), {
             'hash': 'hash1',
             'file_id': 'file_id_1',
             'download_time': '2023-01-01 12:00:00',
         })
 
+    def test_load_download_history_without_file(self):
+        """Test that a missing history file results in an empty history."""
+        history_storage = DownloadHistoryFile(output_dir=self.output_dir, skip_lock=True)
+        with patch('os.path.exists') as mock_exists:
+            history_storage.load_history()
+
+        # The missing file is detected by opening it, without a separate check
+        mock_exists.assert_not_called()
+        self.assertEqual(set(history_storage.get_history_keys()), set())
+
     def test_should_download_force_download(self):
         """Test should_download when force_download is True."""
         # Create history with force_download=True
@@ -92,105 +111,248 @@ class TestDownloadHistory(unittest.TestCase):
         new_hash = 'new_hash'
         self.assertTrue(history.should_download(file_path, new_hash))
 
-    @patch('json.dump')
-    @patch('builtins.open')
-    @patch('os.makedirs')
-    def test_save_download_history(self, mock_makedirs, mock_open, mock_json_dump):
+    def test_save_download_history(self):
         """Test that download history is correctly saved to file."""
         history = DownloadHistoryFile(self.output_dir, skip_lock=True)
         history.add_history_entry('test.osheet', '123', 'abc123', datetime(2023, 1, 1, 12, 0, 0))
         history.add_history_entry('test2.osheet', '456', 'def456', datetime(2023, 1, 2, 12, 0, 0))
         history.save_history()
 
-        # Verify file operations
-        mock_open.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'), 'w')
-        mock_makedirs.assert_called_once_with(self.output_dir, exist_ok=True)
-
-        # Verify the saved data (check that metadata and required file data are included)
-        actual_data = mock_json_dump.call_args[0][0]
-        self.assertIn('_meta', actual_data)
-        self.assertIn('files', actual_data)
-        self.assertEqual(history.get_history_keys(), set(['test.osheet', 'test2.osheet']))
-        self.assertEqual({
-            'file_id': '123',
-            'hash': 'abc123',
-            'download_time': '2023-01-01 12:00:00',
-        }, history.get_history_entry('test.osheet'))
-        self.assertEqual({
-            'file_id': '456',
-            'hash': 'def456',
-            'download_time': '2023-01-02 12:00:00',
-        }, history.get_history_entry('test2.osheet'))
+        # The output directory is created, and the temporary file is renamed to the history file
+        self.assertEqual(os.listdir(self.output_dir), ['.download_history.json'])
+        with open(self.history_file, 'rb') as f:
+            actual_data = json.load(f)
+
         self.assertEqual(actual_data['_meta']['magic'], HISTORY_MAGIC)
         self.assertEqual(actual_data['_meta']['version'], 1)
         self.assertEqual(actual_data['_meta']['program'], 'synology-office-exporter')
+        self.assertEqual(actual_data['files'], {
+            'test.osheet': {
+                'file_id': '123',
+                'hash': 'abc123',
+                'download_time': '2023-01-01 12:00:00',
+            },
+            'test2.osheet': {
+                'file_id': '456',
+                'hash': 'def456',
+                'download_time': '2023-01-02 12:00:00',
+            },
+        })
+
+    def test_interrupted_save_keeps_previous_history(self):
+        """Test that the history file is left intact when writing the new history fails."""
+        self.write_history({'old.osheet': {'file_id': '1', 'hash': 'old', 'download_time': '2023-01-01 12:00:00'}})
+        with open(self.history_file, 'rb') as f:
+            saved_history = f.read()
 
-    @patch('os.path.exists')
-    @patch('builtins.open', new_callable=unittest.mock.mock_open)
-    @patch('json.load')
-    def test_load_download_history_too_new_version(self, mock_json_load, mock_open, mock_exists):
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.add_history_entry('new.osheet', '2', 'new')
+        with patch('synology_office_exporter.download_history._json_dumps', side_effect=OSError('No space left')), \
+                patch('os.replace') as mock_replace:
+            history.save_history()
+
+        mock_replace.assert_not_called()
+        with open(self.history_file, 'rb') as f:
+            self.assertEqual(f.read(), saved_history)
+
+    def test_load_download_history_too_new_version(self):
         """Test that an error is raised when the download history file has a version that's too new."""
-        mock_exists.return_value = True
-        # Simulate history data with a newer version
-        mock_json_load.return_value = {
-            '_meta': {
-                'version': 999,  # Very new version
-                'magic': HISTORY_MAGIC,
-                'created': '2023-01-01 12:00:00',
-                'program': 'synology-office-exporter'
-            },
-            'files': {}
-        }
+        self.write_history({}, version=999)
 
         download_history = DownloadHistoryFile(self.output_dir, skip_lock=True)
         with self.assertRaises(DownloadHistoryError):
             download_history.load_history()
 
-        # Verify that the history file was attempted to be opened
-        mock_exists.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'))
-        mock_open.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'), 'r')
-        mock_json_load.assert_called_once()
+    def test_parse_history(self):
+        """Test that the file entries are extracted from the content of a history file."""
+        files = {'test.osheet': {'file_id': '123', 'hash': 'abc123', 'download_time': '2023-01-01 12:00:00'}}
+        meta = {'version': 1, 'magic': HISTORY_MAGIC}
 
-    @patch('os.path.exists')
-    @patch('builtins.open', new_callable=unittest.mock.mock_open)
-    @patch('json.load')
-    def test_load_download_history_invalid_magic(self, mock_json_load, mock_open, mock_exists):
-        """Test that an error is raised when the download history file has an incorrect magic number."""
-        mock_exists.return_value = True
-        # Simulate history data with an invalid magic number
-        mock_json_load.return_value = {
-            '_meta': {
-                'version': 1,
-                'magic': 'INCORRECT_MAGIC',  # Incorrect magic number
-                'created': '2023-01-01 12:00:00',
-                'program': 'synology-office-exporter'
-            },
-            'files': {}
-        }
+        self.assertEqual(download_history._parse_history({'_meta': meta, 'files': files}), files)
+        self.assertEqual(download_history._parse_history({'_meta': meta}), {})
+        # Files written before the metadata was introduced are ignored
+        self.assertEqual(download_history._parse_history(files), {})
+        self.assertEqual(download_history._parse_history(None), {})
 
-        download_history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+    def test_parse_history_invalid_magic(self):
+        """Test that an error is raised when the download history file has an incorrect magic number."""
         with self.assertRaises(DownloadHistoryError):
-            download_history.load_history()
+            download_history._parse_history({'_meta': {'version': 1, 'magic': 'INCORRECT_MAGIC'}, 'files': {}})
 
-        # Verify that the history file was attempted to be opened
-        mock_exists.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'))
-        mock_open.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'), 'r')
-        mock_json_load.assert_called_once()
-
-    @patch('os.path.exists')
-    @patch('builtins.open', new_callable=unittest.mock.mock_open)
-    @patch('json.load')
-    def test_load_download_history_invalid_json(self, mock_json_load, mock_open, mock_exists):
+    def test_load_download_history_invalid_json(self):
         """Test that an error is raised when the download history file is corrupt."""
-        mock_exists.return_value = True
-        # Simulate an error caused by invalid JSON
-        mock_json_load.side_effect = json.JSONDecodeError('Invalid JSON', '', 0)
+        self.write_history_file(b'{"_meta": {')
 
-        downald_history_storage = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        download_history_storage = DownloadHistoryFile(self.output_dir, skip_lock=True)
         with self.assertRaises(DownloadHistoryError):
-            downald_history_storage.load_history()
+            download_history_storage.load_history()
+
+    def test_save_and_load_round_trip(self):
+        """Test that saved history can be loaded again, with and without orjson installed."""
+        for orjson_module in (download_history.orjson, None):
+            with self.subTest(orjson=orjson_module is not None), \
+                    patch.object(download_history, 'orjson', orjson_module):
+                temp_dir = tempfile.mkdtemp(dir=self.temp_dir)
+
+                history = DownloadHistoryFile(temp_dir, skip_lock=True)
+                history.add_history_entry('/path/to/文書.odoc', '123', 'abc123', datetime(2023, 1, 1, 12, 0, 0))
+                history.save_history()
+                self.assertEqual(os.listdir(temp_dir), ['.download_history.json'])
+
+                loaded = DownloadHistoryFile(temp_dir, skip_lock=True)
+                loaded.load_history()
+                self.assertEqual(loaded.get_history_entry('/path/to/文書.odoc'), {
+                    'file_id': '123',
+                    'hash': 'abc123',
+                    'download_time': '2023-01-01 12:00:00',
+                })
+
+    @unittest.skipIf(download_history.orjson is None, 'orjson is not installed')
+    def test_json_fallback_matches_orjson(self):
+        """Test that the json fallback writes the same compact output as orjson."""
+        data = {'files': {'/path/to/文書.odoc': {'file_id': '123', 'hash': 'abc123'}}, 'version': 1}
+
+        with patch.object(download_history, 'orjson', None):
+            fallback = download_history._json_dumps(data)
+
+        self.assertEqual(fallback, download_history._json_dumps(data))
+
+    def test_save_download_history_in_current_directory(self):
+        """Test that history can be saved when the history file path has no directory component."""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.temp_dir)
+
+        history = DownloadHistoryFile('', skip_lock=True)
+        history.add_history_entry('test.osheet', '123', 'abc123')
+        with patch('os.makedirs') as mock_makedirs:
+            history.save_history()
+
+        mock_makedirs.assert_not_called()
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, '.download_history.json')))
+
+    def test_save_download_history_skips_unchanged_history(self):
+        """Test that the history file is only rewritten after the history has been modified."""
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.save_history()
+        self.assertFalse(os.path.exists(self.history_file))
+
+        history.add_history_entry('test.osheet', '123', 'abc123')
+        history.save_history()
+        self.assertTrue(os.path.exists(self.history_file))
+
+        with patch('builtins.open') as mock_open:
+            history.save_history()
+        mock_open.assert_not_called()
+
+        history.remove_history_entry('test.osheet')
+        history.save_history()
+        loaded = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        loaded.load_history()
+        self.assertEqual(set(loaded.get_history_keys()), set())
+
+    def test_add_history_entry_uses_run_timestamp(self):
+        """Test that entries added without a download time share the time of the current run."""
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        before = datetime.now()
+        history.add_history_entry('a.osheet', '1', 'hash1')
+        history.add_history_entry('b.osheet', '2', 'hash2')
+
+        download_time = history.get_history_entry('a.osheet')['download_time']
+        self.assertEqual(download_time, history.get_history_entry('b.osheet')['download_time'])
+        self.assertGreaterEqual(download_time, str(before))
+
+    def test_get_path_by_file_id(self):
+        """Test that file IDs are mapped to the path they were last recorded under."""
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.add_history_entry('old/test.osheet', '123', 'abc123')
+        self.assertEqual(history.get_path_by_file_id('123'), 'old/test.osheet')
+        self.assertIsNone(history.get_path_by_file_id('456'))
+
+        history.add_history_entry('new/test.osheet', '123', 'abc123')
+        history.remove_history_entry('old/test.osheet')
+        self.assertEqual(history.get_path_by_file_id('123'), 'new/test.osheet')
+
+        history.remove_history_entry('new/test.osheet')
+        self.assertIsNone(history.get_path_by_file_id('123'))
+
+    def test_journal_keeps_changes_of_interrupted_run(self):
+        """Test that changes made after loading the history survive a run which never saved it."""
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.load_history()
+        history.add_history_entry('a.osheet', '1', 'hash1')
+        history.add_history_entry('b.osheet', '2', 'hash2')
+        history.remove_history_entry('a.osheet')
+        # The process is killed here, before save_history() is called
+
+        loaded = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        loaded.load_history()
+        self.assertEqual(set(loaded.get_history_keys()), {'b.osheet'})
+        self.assertFalse(loaded.should_download('b.osheet', 'hash2'))
+
+    def test_journal_skips_truncated_entry(self):
+        """Test that a journal line cut short by a crash is skipped."""
+        os.makedirs(self.output_dir)
+        with open(os.path.join(self.output_dir, '.download_history.journal'), 'wb') as f:
+            f.write(b'{"path": "a.osheet", "entry": {"file_id": "1", "hash": "hash1", "download_time": "t"}}\n')
+            f.write(b'{"path": "b.osheet", "entry": {"file_')
+
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.load_history()
+
+        self.assertEqual(set(history.get_history_keys()), {'a.osheet'})
+
+    def test_journal_discarded_when_history_file_deleted(self):
+        """Test that deleting the history file also drops the changes kept in the journal."""
+        journal_file = os.path.join(self.output_dir, '.download_history.journal')
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.load_history()
+        for i in range(8):
+            history.add_history_entry(f'{i}.osheet', str(i), f'hash{i}')
+        history.save_history()
+        history.unlock_history()
+
+        # A small change is kept in the journal only
+        history.load_history()
+        history.add_history_entry('new.osheet', '9', 'hash9')
+        history.save_history()
+        history.unlock_history()
+        self.assertTrue(os.path.exists(journal_file))
+
+        # The user deletes the history file to start fresh
+        os.remove(self.history_file)
+
+        loaded = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        loaded.load_history()
+        self.assertTrue(loaded.should_download('new.osheet', 'hash9'))
+        self.assertEqual(len(loaded.get_history_keys()), 0)
+        self.assertFalse(os.path.exists(journal_file))
+
+    def test_save_history_compacts_large_journal(self):
+        """Test that small changes stay in the journal and a large journal is merged into the history file."""
+        journal_file = os.path.join(self.output_dir, '.download_history.journal')
+
+        # Everything is new, so the journal is merged into the history file
+        history = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        history.load_history()
+        for i in range(8):
+            history.add_history_entry(f'{i}.osheet', str(i), f'hash{i}')
+        history.save_history()
+        history.unlock_history()
+        self.assertTrue(os.path.exists(self.history_file))
+        self.assertFalse(os.path.exists(journal_file))
+
+        # A single change is only written to the journal
+        history.load_history()
+        history.add_history_entry('0.osheet', '0', 'changed')
+        with open(self.history_file, 'rb') as f:
+            saved_history = f.read()
+        history.save_history()
+        history.unlock_history()
+        with open(self.history_file, 'rb') as f:
+            self.assertEqual(f.read(), saved_history)
+        self.assertTrue(os.path.exists(journal_file))
 
-        # Verify that the history file was attempted to be opened
-        mock_exists.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'))
-        mock_open.assert_called_once_with(os.path.join(self.output_dir, '.download_history.json'), 'r')
-        mock_json_load.assert_called_once()
+        loaded = DownloadHistoryFile(self.output_dir, skip_lock=True)
+        loaded.load_history()
+        self.assertEqual(loaded.get_history_entry('0.osheet')['hash'], 'changed')
+        self.assertEqual(len(loaded.get_history_keys()), 8)
@@ -3,14 +3,14 @@ Tests for the SynologyOfficeExporter class
 """
 
 import unittest
-from unittest.mock import MagicMock, patch, mock_open
-from io import BytesIO
+from unittest.mock import MagicMock, patch
 import os
 import tempfile
 import shutil
 
-from synology_office_exporter.exporter import SynologyOfficeExporter
+from synology_office_exporter.exporter import ExportError, SynologyOfficeExporter
 from synology_office_exporter.download_history import DownloadHistoryFile
+from synology_office_exporter.synology_drive_api import IncompleteDownloadError
 from tests.mock_download_history import MockDownloadHistory
 
 
@@ -56,34 +56,92 @@ class TestExporter(unittest.TestCase):
         self.assertIsNone(
             SynologyOfficeExporter.convert_synology_to_ms_office_filename('not_office_file.txt')
         )
+        self.assertEqual(
+            SynologyOfficeExporter.convert_synology_to_ms_office_filename('path/to/.odoc'),
+            'path/to/.docx'
+        )
+        self.assertIsNone(
+            SynologyOfficeExporter.convert_synology_to_ms_office_filename('path.odoc/README')
+        )
 
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_save_bytesio_to_file(self, mock_file_open, mock_makedirs):
-        """Test saving BytesIO content to a file."""
-        test_content = b'test content'
-        test_path = os.path.join(self.output_dir, 'test.docx')
+    def test_convert_synology_to_ms_office_filename_is_cached(self):
+        """Test that converting the same name again returns the cached result."""
+        convert = SynologyOfficeExporter.convert_synology_to_ms_office_filename
+        self.assertIs(convert('path/to/cached.osheet'), convert('path/to/cached.osheet'))
+
+    def test_save_stream_to_file(self):
+        """Test saving streamed chunks to a file, creating parent directories."""
+        test_path = os.path.join(self.output_dir, 'sub', 'test.docx')
+
+        self.exporter.save_stream_to_file(iter([b'test ', b'content']), test_path)
+
+        with open(test_path, 'rb') as f:
+            self.assertEqual(f.read(), b'test content')
+        self.assertEqual(os.listdir(os.path.dirname(test_path)), ['test.docx'])
 
-        # Create BytesIO with test content
-        data = BytesIO(test_content)
+    def test_save_stream_to_file_without_directory(self):
+        """Test saving to a path without a directory component does not try to create a directory."""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.temp_dir)
 
-        SynologyOfficeExporter.save_bytesio_to_file(data, test_path)
+        with patch('os.makedirs') as mock_makedirs:
+            self.exporter.save_stream_to_file(iter([b'test content']), 'test.docx')
+
+        mock_makedirs.assert_not_called()
+        with open(os.path.join(self.temp_dir, 'test.docx'), 'rb') as f:
+            self.assertEqual(f.read(), b'test content')
+
+    def test_save_stream_to_file_creates_directory_once(self):
+        """Test that an output directory is only created for the first file saved to it."""
+        with patch('os.makedirs', wraps=os.makedirs) as mock_makedirs:
+            for name in ('a.docx', 'b.xlsx'):
+                self.exporter.save_stream_to_file([b'test content'], os.path.join(self.output_dir, name))
 
-        # Verify directory was created
         mock_makedirs.assert_called_once_with(self.output_dir, exist_ok=True)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['a.docx', 'b.xlsx'])
+
+    def test_save_stream_to_file_keeps_existing_file_on_error(self):
+        """Test that a failed download leaves neither a partial file nor a truncated destination."""
+        os.makedirs(self.output_dir)
+        test_path = os.path.join(self.output_dir, 'test.docx')
+        with open(test_path, 'wb') as f:
+            f.write(b'old content')
+
+        def failing_chunks():
+            yield b'new '
+            raise ConnectionError('Connection reset')
+
+        with self.assertRaises(ConnectionError):
+            self.exporter.save_stream_to_file(failing_chunks(), test_path)
+
+        with open(test_path, 'rb') as f:
+            self.assertEqual(f.read(), b'old content')
+        self.assertEqual(os.listdir(self.output_dir), ['test.docx'])
 
-        # Verify file was opened correctly
-        mock_file_open.assert_called_once_with(test_path, 'wb')
+    @patch('time.sleep')
+    def test_truncated_download_is_retried(self, mock_sleep):
+        """Test that a truncated download leaves no partial file and is downloaded again."""
+        def truncated_download(file_id, file_name):
+            yield b'exported'
+            raise IncompleteDownloadError('Received 8 of 13 bytes')
 
-        # Verify content was written
-        mock_file_open().write.assert_called_once_with(test_content)
+        self.mock_synd.download_synology_office_file_stream.side_effect = [
+            truncated_download('123', 'report.osheet'), [b'exported data']]
+
+        self.exporter._process_document('123', 'report.osheet', 'hash1')
+
+        self.assertEqual(os.listdir(self.output_dir), ['report.xlsx'])
+        with open(os.path.join(self.output_dir, 'report.xlsx'), 'rb') as f:
+            self.assertEqual(f.read(), b'exported data')
+        self.assertEqual(self.exporter.downloaded_files, 1)
+        self.assertFalse(self.exporter.had_exceptions)
 
     def test_process_document_tracking(self):
         """Test that documents are properly tracked for deletion detection."""
-        # Mock BytesIO for download
-        self.mock_synd.download_synology_office_file.return_value = BytesIO(b'test content')
+        # Mock the streamed download
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'test content']
 
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file'):
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file'):
             exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir=self.output_dir)
 
             # Clear any auto-loaded history
@@ -104,6 +162,7 @@ class TestExporter(unittest.TestCase):
             exporter.total_found_files = 3
             exporter.skipped_files = 2
             exporter.downloaded_files = 1
+            exporter.copied_files = 5
             exporter.deleted_files = 4
 
             # Get the summary
@@ -114,10 +173,26 @@ class TestExporter(unittest.TestCase):
                 'Total files found for backup: 3\n'
                 'Files skipped: 2\n'
                 'Files downloaded: 1\n'
+                'Files copied: 5\n'
                 'Files deleted: 4\n'
             )
             self.assertEqual(summary, expected_summary)
 
+    def test_error_summary(self):
+        """Test that recorded errors are listed with a note on those which may succeed when run again."""
+        self.assertEqual(self.exporter.get_error_summary(), '')
+
+        self.exporter.errors = [
+            ExportError('/a/report.osheet', 'Connection reset', True),
+            ExportError(None, 'Permission denied', False),
+        ]
+
+        self.assertEqual(self.exporter.get_error_summary(), (
+            'Errors: 2\n'
+            '  /a/report.osheet: Connection reset (temporary, may succeed when run again)\n'
+            '  (unknown): Permission denied\n'
+        ))
+
     def test_download_mydrive_files_with_exception(self):
         exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir=self.output_dir)
 
@@ -145,16 +220,7 @@ class TestExporter(unittest.TestCase):
         exporter._download_teamfolder_files()
         self.assertTrue(exporter.had_exceptions)
 
-    def test_process_document_with_exception(self):
-        exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(), output_dir=self.output_dir)
-
-        # Make download_synology_office_file raise an exception
-        self.mock_synd.download_synology_office_file.side_effect = Exception('Download error')
-
-        exporter._process_document('testfile', '/path/to/test.odoc', 'hash123')
-        self.assertTrue(exporter.had_exceptions)
-
-    @patch('synology_office_exporter.exporter.SynologyOfficeExporter._process_document')
+    @patch.object(SynologyOfficeExporter, '_process_document')
     def test_process_directory(self, mock_process_document):
         """Test the complete process of tracking and removing deleted files."""
         # Mock SynologyDriveEx methods
@@ -170,7 +236,7 @@ class TestExporter(unittest.TestCase):
                 },
             ]}
         }
-        self.mock_synd.download_synology_office_file.return_value = BytesIO(b'file content')
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'file content']
 
         exporter = SynologyOfficeExporter(self.mock_synd, MockDownloadHistory(),
                                           output_dir='/tmp/synology_office_exports')
@@ -180,25 +246,111 @@ class TestExporter(unittest.TestCase):
 
         # Verify that the document was processed
         mock_process_document.assert_called_once_with(
-            'file_id_1', '/path/to/document.odoc', 'hash1'
+            'file_id_1', '/path/to/document.odoc', 'hash1', '/path/to/document.docx'
         )
 
-    def test_get_summary(self):
-        """Test that get_summary returns correct statistics"""
-        # Set up some statistics
-        self.exporter.total_found_files = 10
-        self.exporter.skipped_files = 3
-        self.exporter.downloaded_files = 5
-        self.exporter.deleted_files = 2
-
-        # Get summary
-        summary = self.exporter.get_summary()
-
-        # Check that summary contains all statistics
-        self.assertIn("Total files found for backup: 10", summary)
-        self.assertIn("Files skipped: 3", summary)
-        self.assertIn("Files downloaded: 5", summary)
-        self.assertIn("Files deleted: 2", summary)
+    @patch.object(SynologyOfficeExporter, '_process_document')
+    def test_process_directory_reuses_listing(self, mock_process_document):
+        """Test that a folder reached twice during an export is only listed once."""
+        self.mock_synd.list_folder.return_value = {'success': True, 'data': {'items': []}}
+
+        self.exporter._process_directory('dir_id', 'team/shared')
+        self.exporter._process_directory('dir_id', 'shared')
+
+        self.mock_synd.list_folder.assert_called_once_with('dir_id', offset=0)
+
+    @patch.object(SynologyOfficeExporter, '_process_item')
+    def test_process_directory_lists_all_pages(self, mock_process_item):
+        """Test that the items of every page of a large directory are processed."""
+        pages = {
+            0: {'success': True, 'data': {'items': [{'file_id': '1'}, {'file_id': '2'}], 'total': 3}},
+            2: {'success': True, 'data': {'items': [{'file_id': '3'}], 'total': 3}},
+        }
+        self.mock_synd.list_folder.side_effect = lambda file_id, offset: pages[offset]
+
+        with self.exporter:
+            self.exporter._process_directory('dir_id', 'large')
+
+        self.assertEqual(sorted(c.args[0]['file_id'] for c in mock_process_item.call_args_list), ['1', '2', '3'])
+        self.assertEqual(self.mock_synd.list_folder.call_count, 2)
+
+    @patch.object(SynologyOfficeExporter, '_process_item')
+    def test_process_directory_lists_failed_page_again(self, mock_process_item):
+        """Test that a folder page which failed to be listed is listed again when reached later."""
+        self.mock_synd.list_folder.side_effect = [
+            {'success': False, 'error': {'code': 1002}},
+            {'success': True, 'data': {'items': [{'file_id': '1'}]}},
+            {'success': True, 'data': {'items': [{'file_id': '1'}]}},
+        ]
+
+        self.exporter._process_directory('dir_id', 'team/shared')
+        self.exporter._process_directory('dir_id', 'shared')
+        self.exporter._process_directory('dir_id', 'shared')
+
+        self.assertEqual(self.mock_synd.list_folder.call_count, 2)
+        mock_process_item.assert_called_once_with({'file_id': '1'})
+
+    def test_renamed_document_is_copied_instead_of_downloaded(self):
+        """Test that a document renamed on the NAS is copied from its previous export."""
+        old_output_path = os.path.join(self.output_dir, 'old', 'report.xlsx')
+        os.makedirs(os.path.dirname(old_output_path))
+        with open(old_output_path, 'wb') as f:
+            f.write(b'exported data')
+        self.history_storage.add_history_entry('/old/report.osheet', 'file_id_1', 'hash1')
+
+        self.exporter._process_document('file_id_1', '/new/report.osheet', 'hash1')
+
+        self.mock_synd.download_synology_office_file_stream.assert_not_called()
+        with open(os.path.join(self.output_dir, 'new', 'report.xlsx'), 'rb') as f:
+            self.assertEqual(f.read(), b'exported data')
+        self.assertEqual(self.history_storage.get_path_by_file_id('file_id_1'), '/new/report.osheet')
+        self.assertEqual(self.exporter.copied_files, 1)
+        self.assertEqual(self.exporter.skipped_files, 0)
+        self.assertFalse(self.exporter.had_exceptions)
+
+    def test_renamed_and_modified_document_is_downloaded(self):
+        """Test that a renamed document whose content changed is downloaded again."""
+        self.history_storage.add_history_entry('/old/report.osheet', 'file_id_1', 'hash1')
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'new data']
+
+        self.exporter._process_document('file_id_1', '/new/report.osheet', 'hash2')
+
+        self.mock_synd.download_synology_office_file_stream.assert_called_once()
+        self.assertEqual(self.exporter.downloaded_files, 1)
+
+    def test_force_download_does_not_copy_exports(self):
+        """Test that with force_download, renamed and identical documents are downloaded instead of copied."""
+        old_output_path = os.path.join(self.output_dir, 'old', 'report.xlsx')
+        os.makedirs(os.path.dirname(old_output_path))
+        with open(old_output_path, 'wb') as f:
+            f.write(b'damaged data')
+        self.history_storage.add_history_entry('/old/report.osheet', 'file_id_1', 'hash1')
+        self.mock_synd.download_synology_office_file_stream.side_effect = lambda *args, **kwargs: [b'exported data']
+        exporter = SynologyOfficeExporter(self.mock_synd, self.history_storage, output_dir=self.output_dir,
+                                          force_download=True)
+
+        exporter._process_document('file_id_1', '/new/report.osheet', 'hash1')
+        exporter._process_document('file_id_2', '/b/report copy.osheet', 'hash1')
+
+        self.assertEqual(self.mock_synd.download_synology_office_file_stream.call_count, 2)
+        with open(os.path.join(self.output_dir, 'new', 'report.xlsx'), 'rb') as f:
+            self.assertEqual(f.read(), b'exported data')
+        self.assertEqual(exporter.downloaded_files, 2)
+
+    def test_identical_documents_are_downloaded_once(self):
+        """Test that documents with the same hash in one export are copied instead of downloaded."""
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'exported data']
+
+        self.exporter._process_document('file_id_1', '/a/report.osheet', 'hash1')
+        self.exporter._process_document('file_id_2', '/b/report copy.osheet', 'hash1')
+
+        self.mock_synd.download_synology_office_file_stream.assert_called_once()
+        with open(os.path.join(self.output_dir, 'b', 'report copy.xlsx'), 'rb') as f:
+            self.assertEqual(f.read(), b'exported data')
+        self.assertEqual(self.history_storage.get_path_by_file_id('file_id_2'), '/b/report copy.osheet')
+        self.assertEqual(self.exporter.downloaded_files, 1)
+        self.assertEqual(self.exporter.copied_files, 1)
+        self.assertEqual(self.exporter.skipped_files, 0)
 
 
 if __name__ == '__main__':
@@ -7,7 +7,6 @@ import unittest
 from unittest.mock import patch, MagicMock
 
 from filelock import Timeout
-from io import StringIO
 
 from synology_office_exporter.download_history import DownloadHistoryFile
 from synology_office_exporter.exception import DownloadHistoryError
@@ -18,10 +17,8 @@ class TestFileLock(unittest.TestCase):
     """Test file locking behavior in SynologyOfficeExporter."""
 
     def setUp(self):
-        """Set up test environment with temporary directory and mock objects."""
+        """Set up test environment with temporary directory."""
         self.temp_dir = tempfile.TemporaryDirectory()
-        self.synd_mock = MagicMock()
-        self.stat_buf = StringIO()
 
     def tearDown(self):
         """Clean up temporary directory."""
@@ -72,10 +69,14 @@ class TestFileLock(unittest.TestCase):
 class TestFileLockIntegration(unittest.TestCase):
     """Integration tests for file locking behavior with actual filesystem."""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create the NAS client mock shared by all tests; the exporters never send requests."""
+        cls.synd_mock = MagicMock()
+
     def setUp(self):
-        """Set up test environment with temporary directory and mock objects."""
+        """Set up test environment with temporary directory."""
         self.temp_dir = tempfile.TemporaryDirectory()
-        self.synd_mock = MagicMock()
 
     def tearDown(self):
         """Clean up temporary directory."""
@@ -2,8 +2,8 @@
 import unittest
 from unittest.mock import Mock, MagicMock, patch
 import os
+import shutil
 import tempfile
-from io import BytesIO
 
 from synology_office_exporter.exporter import SynologyOfficeExporter
 from tests.mock_download_history import MockDownloadHistory
@@ -29,16 +29,12 @@ class TestStats(unittest.TestCase):
 
     def tearDown(self):
         # Remove the temporary directory
-        history_file = os.path.join(self.temp_dir, '.download_history.json')
-        if os.path.exists(history_file):
-            os.remove(history_file)
-        os.rmdir(self.temp_dir)
+        shutil.rmtree(self.temp_dir)
 
     def test_process_document_new_file(self):
         """Test processing a new file"""
         # Set up the mock
-        mock_data = BytesIO(b'test data')
-        self.mock_synd.download_synology_office_file.return_value = mock_data
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'test data']
 
         # File information for testing
         file_id = 'test_file_id'
@@ -46,7 +42,7 @@ class TestStats(unittest.TestCase):
         file_hash = 'test_hash'
 
         # Execute the test
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save:
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
             self.exporter._process_document(file_id, display_path, file_hash)
 
             # Verify
@@ -67,8 +63,12 @@ class TestStats(unittest.TestCase):
         download_history.should_download.return_value = False
         exporter = SynologyOfficeExporter(self.mock_synd, download_history, output_dir=self.temp_dir)
 
+        # The exported copy from the previous download is still present
+        output_path = os.path.join(self.temp_dir, 'test_document.docx')
+        open(output_path, 'wb').close()
+
         # Execute the test
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save:
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
             exporter._process_document(file_id, display_path, file_hash)
 
             # Verify
@@ -85,7 +85,7 @@ class TestStats(unittest.TestCase):
         file_hash = 'test_hash'
 
         # Execute the test
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save:
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
             self.exporter._process_document(file_id, display_path, file_hash)
 
             # Verify
@@ -115,10 +115,10 @@ class TestStats(unittest.TestCase):
         }
 
         # Set up the mock
-        self.mock_synd.download_synology_office_file.return_value = BytesIO(b'test data')
+        self.mock_synd.download_synology_office_file_stream.return_value = [b'test data']
 
         # Execute the test
-        with patch.object(SynologyOfficeExporter, 'save_bytesio_to_file') as mock_save:
+        with patch.object(SynologyOfficeExporter, 'save_stream_to_file') as mock_save:
             self.exporter._process_document(file_id, display_path, file_hash)
 
             # Verify
@@ -0,0 +1,129 @@
+"""Unit tests for the SynologyDriveEx extensions of the Synology Drive API client."""
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from synology_drive_api.base import SynologyException, SynologySession
+
+from synology_office_exporter.synology_drive_api import IncompleteDownloadError, SynologyDriveEx
+
+
+class TestSynologyDriveEx(unittest.TestCase):
+    """Test suite for SynologyDriveEx."""
+
+    def setUp(self):
+        # requests.Session is a class attribute of SynologySession; use a fresh one per test
+        session_patcher = patch.object(SynologySession, 'req_session', requests.Session())
+        session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+        self.synd = SynologyDriveEx('user', 'pass', 'nas.example.com', dsm_version='7')
+
+    def test_configure_connection_pool(self):
+        """Test that a single adapter with the requested pool size is mounted for all requests."""
+        self.synd.configure_connection_pool(9)
+
+        req_session = self.synd.session.req_session
+        adapter = req_session.get_adapter('https://nas.example.com:5001/webapi/entry.cgi')
+        self.assertIs(adapter, req_session.get_adapter('http://nas.example.com:5000/webapi/entry.cgi'))
+        self.assertEqual(adapter._pool_maxsize, 9)
+        # Failed requests are retried by the exporter only, so the adapter must not retry them
+        self.assertEqual(adapter.max_retries.total, 0)
+        self.assertFalse(adapter.max_retries.status_forcelist)
+
+    def test_download_synology_office_file_stream(self):
+        """Test that the exported file is requested with streaming and yielded chunk by chunk."""
+        self.synd.get_file_or_folder_info = MagicMock(
+            return_value={'data': {'name': 'report.osheet', 'file_id': '123'}})
+        response = MagicMock(status_code=200, headers={})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = iter([b'chunk1', b'chunk2'])
+
+        with patch.object(self.synd.session.req_session, 'get', return_value=response) as mock_get:
+            chunks = list(self.synd.download_synology_office_file_stream('123', chunk_size=1024))
+
+        self.assertEqual(chunks, [b'chunk1', b'chunk2'])
+        self.synd.get_file_or_folder_info.assert_called_once_with('123')
+        args, kwargs = mock_get.call_args
+        self.assertTrue(args[0].endswith('/webapi/entry.cgi/report.xlsx'))
+        self.assertTrue(kwargs['stream'])
+        self.assertEqual(kwargs['params']['api'], 'SYNO.Office.Export')
+        self.assertEqual(kwargs['params']['path'], 'id:123')
+        response.iter_content.assert_called_once_with(chunk_size=1024)
+
+    def test_download_synology_office_file_stream_with_known_name(self):
+        """Test that no metadata request is sent when the file name is passed in."""
+        self.synd.get_file_or_folder_info = MagicMock()
+        response = MagicMock(status_code=200, headers={})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = iter([b'chunk'])
+
+        with patch.object(self.synd.session.req_session, 'get', return_value=response) as mock_get:
+            chunks = list(self.synd.download_synology_office_file_stream('123', file_name='notes.odoc'))
+
+        self.assertEqual(chunks, [b'chunk'])
+        self.synd.get_file_or_folder_info.assert_not_called()
+        self.assertTrue(mock_get.call_args[0][0].endswith('/webapi/entry.cgi/notes.docx'))
+        self.assertEqual(mock_get.call_args[1]['params']['path'], 'id:123')
+
+    def test_download_synology_office_file_stream_truncated(self):
+        """Test that a body shorter than its Content-Length is reported as an incomplete download."""
+        response = MagicMock(status_code=200, headers={'Content-Length': '12'})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = iter([b'chunk1'])
+
+        with patch.object(self.synd.session.req_session, 'get', return_value=response):
+            chunks = self.synd.download_synology_office_file_stream('123', file_name='notes.odoc')
+            self.assertEqual(next(chunks), b'chunk1')
+            with self.assertRaises(IncompleteDownloadError):
+                next(chunks)
+
+    def test_download_synology_office_file_stream_compressed(self):
+        """Test that the length of a compressed body is not compared with the decoded chunks."""
+        response = MagicMock(status_code=200, headers={'Content-Length': '3', 'Content-Encoding': 'gzip'})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = iter([b'decoded data'])
+
+        with patch.object(self.synd.session.req_session, 'get', return_value=response):
+            chunks = list(self.synd.download_synology_office_file_stream('123', file_name='notes.odoc'))
+
+        self.assertEqual(chunks, [b'decoded data'])
+
+    def test_list_folder_page(self):
+        """Test that a page of a folder is requested by offset."""
+        with patch.object(self.synd.session, 'http_get', return_value={'success': True}) as mock_get:
+            self.synd.list_folder('552146100935505098', offset=1000)
+
+        params = mock_get.call_args[1]['params']
+        self.assertEqual(params['path'], 'id:552146100935505098')
+        self.assertEqual(params['offset'], 1000)
+        self.assertEqual(params['limit'], 1000)
+
+    def test_busy_server_response_raises_synology_exception(self):
+        """Test that an error status reaches the caller as SynologyException carrying the response."""
+        response = requests.Response()
+        response.status_code = 503
+        response._content = b''
+
+        with patch.object(self.synd.session.req_session, 'request', return_value=response) as mock_request:
+            with self.assertRaises(SynologyException) as cm:
+                self.synd.list_folder('552146100935505098')
+
+        mock_request.assert_called_once()
+        self.assertEqual(cm.exception.response.status_code, 503)
+
+    @patch('synology_office_exporter.synology_drive_api.LIST_PAGE_SIZE', 2)
+    def test_shared_with_me_lists_all_pages(self):
+        """Test that shared files beyond the first page are listed."""
+        pages = [
+            {'success': True, 'data': {'items': [{'file_id': '1'}, {'file_id': '2'}], 'total': 3}},
+            {'success': True, 'data': {'items': [{'file_id': '3'}], 'total': 3}},
+        ]
+        with patch.object(self.synd.session, 'http_get', side_effect=pages) as mock_get:
+            items = self.synd.shared_with_me()
+
+        self.assertEqual([item['file_id'] for item in items], ['1', '2', '3'])
+        self.assertEqual([c[1]['params']['offset'] for c in mock_get.call_args_list], [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()